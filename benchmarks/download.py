@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+""" Benchmarks of esneft_tools.download (run with asv) """
+
+import os
+import shutil
+import pathlib
+import tempfile
+import numpy as np
+import pandas as pd
+from esneft_tools import download
+from .fixtures import DATA
+
+
+class FromHost:
+    """ Retrieve bundled datasets from a local (file://) host """
+    params = (['gpRegistration', 'qof', 'esneftLSOA'], ['cold', 'warm'])
+    param_names = ['name', 'cache']
+    number = 1
+    timeout = 300
+
+    def setup(self, name, cache):
+        self.tmp = tempfile.mkdtemp()
+        self.warm = self._getData(f'{self.tmp}/warm')
+        if cache == 'warm':
+            self.warm.fromHost(name)
+
+    def teardown(self, name, cache):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _getData(self, directory):
+        getData = download.getData(cache=directory)
+        getData.host = DATA.as_uri()
+        return getData
+
+    def _fromHost(self, name, cache):
+        if cache == 'warm':
+            return self.warm.fromHost(name)
+        # A new cache per call so every repeat is a miss
+        return self._getData(tempfile.mkdtemp(dir=self.tmp)).fromHost(name)
+
+    def time_fromHost(self, name, cache):
+        self._fromHost(name, cache)
+
+    def peakmem_fromHost(self, name, cache):
+        self._fromHost(name, cache)
+
+
+class StreamDownload:
+    """ Streamed, hashed download - peak memory should not grow with size """
+    params = ([16, 256],)
+    param_names = ['megabytes']
+    number = 1
+    timeout = 300
+
+    def setup(self, megabytes):
+        self.tmp = tempfile.mkdtemp()
+        rng = np.random.default_rng(42)
+        with open(f'{self.tmp}/source.bin', 'wb') as fh:
+            for _ in range(megabytes):
+                fh.write(rng.bytes(1_048_576))
+        self.url = pathlib.Path(f'{self.tmp}/source.bin').as_uri()
+        self.getData = download.getData(cache=f'{self.tmp}/cache')
+
+    def teardown(self, megabytes):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _download(self):
+        out = f'{self.tmp}/out.bin'
+        self.getData._download(self.url, out)
+        os.remove(out)
+
+    def time_download(self, megabytes):
+        self._download()
+
+    def peakmem_download(self, megabytes):
+        self._download()
+
+
+def _gpStaff(size, seed=42):
+    """ Synthetic epracmem rows after date parsing """
+    rng = np.random.default_rng(seed)
+    referenceDate = pd.Timestamp('2023-01-01')
+    joined = referenceDate - pd.to_timedelta(
+        rng.integers(0, 30 * 365, size), unit='D')
+    left = joined + pd.to_timedelta(rng.integers(0, 20 * 365, size), unit='D')
+    current = (left >= referenceDate) | (rng.random(size) < 0.3)
+    return pd.DataFrame({
+        'PractionerCode': [f'G{i:07d}' for i in range(size)],
+        'OrganisationCode': [
+            f'P{i:05d}' for i in rng.integers(0, size // 10, size)],
+        'Joined': joined,
+        'Left': left.where(~current, referenceDate),
+        'Current': current,
+    })
+
+
+class SummariseStaff:
+    """ Per-practice staff turnover at increasing membership counts """
+    params = ([100_000, 1_000_000],)
+    param_names = ['rows']
+    timeout = 300
+
+    def setup(self, rows):
+        self.gpStaff = _gpStaff(rows)
+        self.getData = download.getData(cache=tempfile.mkdtemp())
+
+    def teardown(self, rows):
+        shutil.rmtree(self.getData.cache, ignore_errors=True)
+
+    def time_summarise(self, rows):
+        self.getData._summariseStaff(self.gpStaff)
+
+    def peakmem_summarise(self, rows):
+        self.getData._summariseStaff(self.gpStaff)
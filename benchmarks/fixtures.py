@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+""" Offline benchmark inputs built from the bundled data/*.parquet files """
+
+import pathlib
+import functools
+import numpy as np
+import pandas as pd
+
+
+DATA = pathlib.Path(__file__).resolve().parents[1] / 'data'
+
+BUNDLED = ({
+    'imdLSOA': 'imd-statistics.parquet',
+    'ethnicityLSOA': 'ethnicity-lsoa.parquet',
+    'areaLSOA': 'land-area-lsoa.parquet',
+    'gpRegistration': 'gp-registrations.parquet',
+    'gpPractice': 'gp-practices.parquet',
+    'gpStaff': 'gp-staff.parquet',
+    'qof': 'qof.parquet',
+    'esneftLSOA': 'lsoa-esneft.json',
+})
+
+
+@functools.lru_cache(maxsize=None)
+def _bundled():
+    data = {
+        name: pd.read_parquet(DATA / file)
+        for name, file in BUNDLED.items() if file.endswith('.parquet')
+    }
+    data['esneftLSOA'] = pd.read_json(
+        DATA / BUNDLED['esneftLSOA'], typ='series')
+    return data
+
+
+def bundled():
+    """ Return a copy of the bundled datasets keyed by getData name """
+    return {name: data.copy() for name, data in _bundled().items()}
+
+
+def _replicate(index, scale):
+    """ Suffix codes with a replicate number (the first is unchanged) """
+    return [index] + [index + f'-{i}' for i in range(1, scale)]
+
+
+def _scaleIndexed(data, scale):
+    """ Replicate a dataset indexed by LSOA or practice code """
+    replicas = []
+    for index in _replicate(data.index.astype(str), scale):
+        replicas.append(data.set_axis(index.rename(data.index.name)))
+    return pd.concat(replicas)
+
+
+def _scaleRegistration(gpRegistration, scale):
+    """ Replicate registrations with matching LSOA and practice codes """
+    replicas = []
+    lsoas = _replicate(gpRegistration['LSOA11CD'].astype(str), scale)
+    practices = _replicate(
+        gpRegistration['OrganisationCode'].astype(str), scale)
+    for lsoa, practice in zip(lsoas, practices):
+        replicas.append(
+            gpRegistration.assign(LSOA11CD=lsoa, OrganisationCode=practice))
+    return pd.concat(replicas, ignore_index=True)
+
+
+def postcodeLSOA(imdLSOA, esneftLSOA, gpPractice, size=100_000, seed=42):
+    """ Synthetic postcode lookup covering every practice postcode """
+    rng = np.random.default_rng(seed)
+    practices = gpPractice['PCDS'].dropna().unique()
+    postcodes = pd.Index(practices).append(pd.Index(
+        [f'ZZ{i} {i % 10}ZZ' for i in range(max(size - len(practices), 0))]))
+    data = pd.DataFrame({
+        'LSOA11CD': rng.choice(imdLSOA.index, len(postcodes)),
+        'Lat': rng.uniform(50.0, 55.0, len(postcodes)),
+        'Long': rng.uniform(-3.0, 1.7, len(postcodes)),
+    }, index=postcodes.rename('PCDS'))
+    data['ESNEFT'] = data['LSOA11CD'].isin(esneftLSOA)
+    return data
+
+
+def populationLSOA(lsoas, seed=42):
+    """ Synthetic single year of age population (0 - 90+) by sex """
+    rng = np.random.default_rng(seed)
+    ages = np.arange(91)
+    sexes = ['Male', 'Female']
+    size = len(lsoas) * len(ages) * len(sexes)
+    return pd.DataFrame({
+        'LSOA11CD': np.repeat(np.asarray(lsoas), len(ages) * len(sexes)),
+        'Age': np.tile(ages, len(lsoas) * len(sexes)),
+        'Population': rng.integers(0, 30, size),
+        'Sex': np.tile(np.repeat(sexes, len(ages)), len(lsoas)),
+    })
+
+
+def processInputs(scale=1, seed=42):
+    """ Inputs to getGPsummary / getLSOAsummary with LSOAs and practices
+        replicated scale times """
+    data = bundled()
+    for name in ['imdLSOA', 'ethnicityLSOA', 'areaLSOA',
+                 'gpPractice', 'gpStaff', 'qof']:
+        data[name] = _scaleIndexed(data[name], scale)
+    data['gpRegistration'] = _scaleRegistration(data['gpRegistration'], scale)
+    data['esneftLSOA'] = pd.Series(np.concatenate(
+        _replicate(data['esneftLSOA'].astype(str), scale)))
+    data['postcodeLSOA'] = postcodeLSOA(
+        data['imdLSOA'], data['esneftLSOA'], data['gpPractice'],
+        size=100_000 * scale, seed=seed)
+    data['populationLSOA'] = populationLSOA(data['imdLSOA'].index, seed=seed)
+    data['esneftOSM'] = None
+    return data
+
+
+def esneftPostcodes(size=None):
+    """ Postcodes of practices within ESNEFT LSOAs (for synthetic data) """
+    gpRegistration = pd.read_parquet(
+        DATA / BUNDLED['gpRegistration'],
+        columns=['OrganisationCode', 'LSOA11CD'])
+    gpPractice = pd.read_parquet(DATA / BUNDLED['gpPractice'], columns=['PCDS'])
+    esneftLSOA = pd.read_json(DATA / BUNDLED['esneftLSOA'], typ='series')
+    codes = gpRegistration.loc[
+        gpRegistration['LSOA11CD'].isin(esneftLSOA), 'OrganisationCode']
+    postcodes = (gpPractice
+        .loc[gpPractice.index.isin(codes), 'PCDS'].dropna().unique())
+    return pd.Index(postcodes if size is None else postcodes[:size])
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+
+""" Benchmarks of esneft_tools.process (run with asv) """
+
+import os
+import numpy as np
+import pandas as pd
+from esneft_tools import process
+from .fixtures import DATA, processInputs
+
+
+def _loadRegistration(region):
+    """ Load bundled GP registrations merged with IoD scores """
+    gpRegistration = pd.read_parquet(DATA / 'gp-registrations.parquet')
+    imdLSOA = pd.read_parquet(DATA / 'imd-statistics.parquet')
+    if region == 'ESNEFT':
+        esneftLSOA = pd.read_json(DATA / 'lsoa-esneft.json', typ='series')
+        gpRegistration = gpRegistration.loc[
+            gpRegistration['LSOA11CD'].isin(esneftLSOA)]
+    iod_cols = process._parseIoDcols(imdLSOA)
+    merged = pd.merge(
+        gpRegistration, imdLSOA[iod_cols],
+        left_on='LSOA11CD', right_index=True)
+    return merged, iod_cols
+
+
+class Summary:
+    """ Practice and LSOA summaries with LSOAs and practices replicated """
+    params = ([1, 2],)
+    param_names = ['scale']
+    timeout = 600
+
+    def setup(self, scale):
+        self.data = processInputs(scale)
+
+    def time_gp_summary(self, scale):
+        process.getGPsummary(**self.data, iod_cols='IMD')
+
+    def peakmem_gp_summary(self, scale):
+        process.getGPsummary(**self.data, iod_cols='IMD')
+
+    def time_lsoa_summary(self, scale):
+        process.getLSOAsummary(**self.data, iod_cols='IMD')
+
+    def peakmem_lsoa_summary(self, scale):
+        process.getLSOAsummary(**self.data, iod_cols='IMD')
+
+
+class GPweightedMean:
+    """ Compare groupby-apply and vectorised practice weighted means """
+    params = (['ESNEFT', 'England'],)
+    param_names = ['region']
+    timeout = 300
+
+    def setup(self, region):
+        self.merged, self.iod_cols = _loadRegistration(region)
+
+    def time_apply(self, region):
+        (self.merged
+            .groupby(['OrganisationCode'])
+            .apply(process._weightedMean, self.iod_cols))
+
+    def time_vectorised(self, region):
+        process._groupWeightedMean(
+            self.merged, 'OrganisationCode', self.iod_cols)
+
+
+def _gridGraph(size, seed=42):
+    """ Synthetic directed road grid with x/y coordinates """
+    import networkx as nx
+    rng = np.random.default_rng(seed)
+    G = nx.MultiDiGraph(crs='epsg:4326')
+    for i in range(size):
+        for j in range(size):
+            G.add_node(f'{i}-{j}', x=1 + (i * 0.001), y=52 + (j * 0.001))
+    for u, v in nx.grid_2d_graph(size, size).edges():
+        u, v = f'{u[0]}-{u[1]}', f'{v[0]}-{v[1]}'
+        G.add_edge(u, v, length=float(rng.integers(50, 150)))
+        G.add_edge(v, u, length=float(rng.integers(50, 150)))
+    return G
+
+
+def _esneftNetwork():
+    """ Load ESNEFT roadNetwork from an existing data cache (no download) """
+    from esneft_tools import download
+    from esneft_tools.network import roadNetwork
+    cache = os.environ.get('ESNEFT_CACHE', './.data-cache')
+    if not os.path.exists(f'{cache}/manifest.json'):
+        raise NotImplementedError('ESNEFT highway graph not cached.')
+    getData = download.getData(cache=cache)
+    # Skip rather than download or rebuild the network from OSM XML
+    entry = getData.store.entry('esneft-highways.osm')
+    meta = roadNetwork.readMeta(getData._getOSMcache())
+    if (entry is None) or (meta is None) or (
+            meta['sourceHash'] != entry['sha256']):
+        raise NotImplementedError('ESNEFT highway graph not cached.')
+    return getData.fromHost('esneftOSM')
+
+
+def _egoLoop(G, locations, dist):
+    """ Reference implementation: one ego graph + Dijkstra per site """
+    import networkx as nx
+    distances = {}
+    nodeSites = (locations.groupby('Node').apply(
+        lambda x: tuple(x.index)).to_dict())
+    for refNode in locations['Node'].unique():
+        subgraph = nx.ego_graph(G, refNode, radius=dist, distance='length')
+        allShortest = nx.shortest_path_length(
+            subgraph, refNode, weight='length', method='dijkstra')
+        for node, distance in allShortest.items():
+            if distance < distances.get(node, (np.inf,))[0]:
+                distances[node] = (distance, nodeSites[refNode])
+    return distances
+
+
+class TravelDistance:
+    """ Compare per-site ego graph loop and multi-source traversal """
+    params = (['grid', 'ESNEFT'], [10, 100])
+    param_names = ['graph', 'sites']
+    timeout = 600
+
+    def setup(self, graph, sites):
+        if graph == 'grid':
+            self.network = self.G = _gridGraph(200)
+        else:
+            # Multi-source runs on the cached arrays, the ego loop on networkx
+            self.network = _esneftNetwork()
+            self.G = self.network.toGraph()
+        rng = np.random.default_rng(42)
+        nodes = rng.choice(list(self.G.nodes()), sites, replace=False)
+        self.locations = pd.DataFrame({
+            'Node': nodes,
+            'Lat': [self.G.nodes[node]['y'] for node in nodes],
+            'Long': [self.G.nodes[node]['x'] for node in nodes],
+        }, index=[f'site{i}' for i in range(sites)])
+        self.dist = 2000 if graph == 'grid' else 20000
+
+    def time_ego_loop(self, graph, sites):
+        _egoLoop(self.G, self.locations, self.dist)
+
+    def time_multi_source(self, graph, sites):
+        process.computeTravelDistance(self.network, self.locations, self.dist)
+
+    def peakmem_multi_source(self, graph, sites):
+        process.computeTravelDistance(self.network, self.locations, self.dist)
+
+
+def _events(size, seed=42):
+    """ Synthetic prepTime output with multi-day episodes """
+    rng = np.random.default_rng(seed)
+    arrival = (pd.Timestamp('2018-01-01')
+               + pd.to_timedelta(rng.integers(0, 4 * 365, size), unit='D'))
+    departure = arrival + pd.to_timedelta(rng.integers(0, 30, size), unit='D')
+    events = pd.DataFrame({
+        'site': rng.choice(['Ipswich', 'Colchester'], size),
+        'arrival': arrival, 'departure': departure})
+    return process.prepTime(
+        events, start='arrival', end='departure',
+        group='site', interval='1D')
+
+
+def _explodeTime(df, interval):
+    """ Reference implementation: one date_range per event then explode """
+    mergeFunc = lambda x: pd.date_range(x['start'], x['end'], freq=interval)
+    df = pd.merge(
+        df, df.apply(mergeFunc, axis=1).explode().rename('period'),
+        left_index=True, right_index=True)
+    df['period'] = df['period'].dt.to_period(interval)
+    return df.groupby(['group', 'period']).size()
+
+
+class SummariseTime:
+    """ Interval sweep event counting at increasing event counts """
+    params = ([100_000, 1_000_000, 10_000_000],)
+    param_names = ['rows']
+    timeout = 600
+
+    def setup(self, rows):
+        self.events = _events(rows)
+
+    def time_summarise(self, rows):
+        process.summariseTime(self.events, interval='1D', normByGroup=True)
+
+    def peakmem_summarise(self, rows):
+        process.summariseTime(self.events, interval='1D', normByGroup=True)
+
+
+class SummariseTimeExplode:
+    """ Reference row-wise date_range + explode (small inputs only) """
+    params = ([10_000, 100_000],)
+    param_names = ['rows']
+    timeout = 600
+
+    def setup(self, rows):
+        self.events = _events(rows)
+
+    def time_explode(self, rows):
+        _explodeTime(self.events, interval='1D')
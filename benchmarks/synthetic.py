@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+""" Benchmarks of esneft_tools.synthetic (run with asv) """
+
+import shutil
+import tempfile
+from esneft_tools import process, synthetic
+from .fixtures import esneftPostcodes
+
+
+class Emergency:
+    """ In-memory synthetic emergency attendances """
+    params = ([10_000, 100_000, 1_000_000],)
+    param_names = ['size']
+    timeout = 300
+
+    def setup(self, size):
+        self.postcodes = esneftPostcodes()
+
+    def time_emergency(self, size):
+        synthetic.emergency(size, postcodes=self.postcodes)
+
+    def peakmem_emergency(self, size):
+        synthetic.emergency(size, postcodes=self.postcodes)
+
+
+class EmergencyToParquet:
+    """ Chunked parquet output - peak memory is bounded by chunksize """
+    params = ([1_000_000, 5_000_000],)
+    param_names = ['size']
+    number = 1
+    timeout = 600
+
+    def setup(self, size):
+        self.postcodes = esneftPostcodes()
+        self.tmp = tempfile.mkdtemp()
+
+    def teardown(self, size):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def time_to_parquet(self, size):
+        synthetic.emergencyToParquet(
+            f'{self.tmp}/emergency.parquet', size, postcodes=self.postcodes)
+
+    def peakmem_to_parquet(self, size):
+        synthetic.emergencyToParquet(
+            f'{self.tmp}/emergency.parquet', size, postcodes=self.postcodes)
+
+
+class EmergencyTimeline:
+    """ Synthetic attendances through prepTime and summariseTime """
+    params = ([100_000, 1_000_000], ['1D', '1W'])
+    param_names = ['size', 'interval']
+    timeout = 600
+
+    def setup(self, size, interval):
+        self.data = synthetic.emergency(size, postcodes=esneftPostcodes())
+
+    def _timeline(self, interval):
+        events = process.prepTime(
+            self.data, start='arrivalDateTime', end='departDateTime',
+            group='site', interval=interval)
+        return process.summariseTime(events, interval, normByGroup=True)
+
+    def time_timeline(self, size, interval):
+        self._timeline(interval)
+
+    def peakmem_timeline(self, size, interval):
+        self._timeline(interval)
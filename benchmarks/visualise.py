@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+""" Benchmarks of esneft_tools.visualise (run with asv) """
+
+import pathlib
+import numpy as np
+import pandas as pd
+from esneft_tools import visualise
+
+
+DATA = pathlib.Path(__file__).resolve().parents[1] / 'data'
+
+
+def _lsoaFixture(vertices=500, seed=42):
+    """ ESNEFT IoD scores with synthetic LSOA polygons """
+    rng = np.random.default_rng(seed)
+    esneftLSOA = pd.read_json(DATA / 'lsoa-esneft.json', typ='series')
+    imdLSOA = pd.read_parquet(DATA / 'imd-statistics.parquet')
+    LSOAsummary = imdLSOA.loc[imdLSOA.index.isin(esneftLSOA)]
+    theta = np.linspace(0, 2 * np.pi, vertices)
+    features = []
+    for code in LSOAsummary.index:
+        long, lat = rng.uniform(0.6, 1.6), rng.uniform(51.8, 52.4)
+        radius = 0.005 * (1 + 0.05 * rng.standard_normal(vertices))
+        ring = np.column_stack([
+            long + radius * np.cos(theta), lat + radius * np.sin(theta)])
+        ring[-1] = ring[0]
+        features.append({
+            'type': 'Feature', 'id': code, 'properties': {},
+            'geometry': {'type': 'Polygon', 'coordinates': [ring.tolist()]}
+        })
+    geojson = {'type': 'FeatureCollection', 'features': features}
+    return LSOAsummary, geojson
+
+
+class ChoroplethPayload:
+    """ Compare one figure per metric with a single multi-layer figure """
+    params = ([None, 5, 4],)
+    param_names = ['precision']
+    timeout = 300
+
+    def setup(self, precision):
+        self.LSOAsummary, self.geojson = _lsoaFixture()
+        self.layers = ([
+            'IMD', 'Income', 'Employment', 'Education', 'Health',
+            'Crime', 'Barriers (H&S)', 'Environment'
+        ])
+
+    def _separate(self, precision):
+        return [
+            visualise.choroplethLSOA(
+                self.LSOAsummary, self.geojson, layer,
+                precision=precision).to_json()
+            for layer in self.layers]
+
+    def _layered(self, precision):
+        return visualise.choroplethLSOA(
+            self.LSOAsummary, self.geojson, self.layers,
+            precision=precision).to_json()
+
+    def time_separate(self, precision):
+        self._separate(precision)
+
+    def time_layered(self, precision):
+        self._layered(precision)
+
+    def track_bytes_separate(self, precision):
+        return sum(len(payload) for payload in self._separate(precision))
+    track_bytes_separate.unit = 'bytes'
+
+    def track_bytes_layered(self, precision):
+        return len(self._layered(precision))
+    track_bytes_layered.unit = 'bytes'
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+
+import os
+import json
+import time
+import logging
+import pathlib
+import tempfile
+import contextlib
+
+
+logger = logging.getLogger(__name__)
+
+
+try:
+    import fcntl
+except ModuleNotFoundError:
+    import msvcrt
+
+
+class dataCache():
+    """ Content-addressed, size-bounded file cache with a JSON manifest.
+
+    Files are stored as objects/<sha256><suffix> and a manifest maps each
+    logical key (e.g. 'qof.parquet') to its object, source URL, size,
+    modification and access time. A lock file serialises manifest updates
+    so several processes can share one cache directory. A returned path
+    may be evicted by another process before it is read, so callers should
+    retry once on FileNotFoundError (see getData._retryEvicted).
+    """
+
+    def __init__(self, directory: str, maxSize: int = None, hasher=None):
+        self.directory = directory
+        self.maxSize = maxSize
+        self.hasher = hasher
+        self.objects = f'{directory}/objects'
+        self.manifestPath = f'{directory}/manifest.json'
+        os.makedirs(self.objects, exist_ok=True)
+
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """ Hold an exclusive inter-process lock on the cache """
+        with open(f'{self.directory}/.lock', 'a+') as fh:
+            if 'fcntl' in globals():
+                fcntl.flock(fh, fcntl.LOCK_EX)
+            else:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if 'fcntl' in globals():
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+                else:
+                    fh.seek(0)
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+    def _readManifest(self):
+        try:
+            with open(self.manifestPath) as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+
+    def _writeManifest(self, manifest: dict):
+        tmp = f'{self.manifestPath}.tmp-{os.getpid()}'
+        with open(tmp, 'w') as fh:
+            json.dump(manifest, fh, indent=1)
+        os.replace(tmp, self.manifestPath)
+
+
+    def tempPath(self, suffix: str = ''):
+        """ Return a new temporary path on the same filesystem """
+        fd, path = tempfile.mkstemp(
+            suffix=suffix, prefix='.tmp-', dir=self.directory)
+        os.close(fd)
+        return path
+
+
+    def _isValid(self, entry: dict, full: bool = False):
+        """ Cheap size/mtime check, or full hash check if required """
+        path = entry['path']
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if stat.st_size != entry['size']:
+            return False
+        if (not full) and (stat.st_mtime_ns == entry['mtime']):
+            return True
+        if self.hasher is None:
+            return False
+        return self.hasher([path], readSize=1_048_576) == entry['sha256']
+
+
+    def get(self, key: str, full: bool = False):
+        """ Return path to a verified cached file (or None) """
+        with self._locked():
+            manifest = self._readManifest()
+            entry = manifest.get(key)
+            if entry is None:
+                return None
+            if not self._isValid(entry, full):
+                logger.warning(f'Cached {key} failed verification.')
+                del manifest[key]
+                self._removeUnreferenced(entry['path'], manifest)
+                self._writeManifest(manifest)
+                return None
+            entry['atime'] = time.time()
+            entry['mtime'] = os.stat(entry['path']).st_mtime_ns
+            self._writeManifest(manifest)
+        logger.info(f'Data already cached - loading from {entry["path"]}')
+        return entry['path']
+
+
+    def entry(self, key: str):
+        """ Return manifest record for key (or None) """
+        with self._locked():
+            return self._readManifest().get(key)
+
+
+    def put(self, key: str, path: str, url: str = None, sha256: str = None):
+        """ Atomically move a file into the cache and record it """
+        if sha256 is None:
+            sha256 = self.hasher([path], readSize=1_048_576)
+        suffix = ''.join(pathlib.Path(key).suffixes)
+        out = f'{self.objects}/{sha256}{suffix}'
+        with self._locked():
+            os.replace(path, out)
+            manifest = self._readManifest()
+            previous = manifest.get(key)
+            stat = os.stat(out)
+            manifest[key] = ({
+                'path': out,
+                'url': url,
+                'sha256': sha256,
+                'size': stat.st_size,
+                'mtime': stat.st_mtime_ns,
+                'atime': time.time(),
+            })
+            if (previous is not None) and (previous['path'] != out):
+                self._removeUnreferenced(previous['path'], manifest)
+            self._evict(manifest, keep=key)
+            self._writeManifest(manifest)
+        return out
+
+
+    def remove(self, key: str):
+        """ Drop key from the cache, deleting its object if unreferenced """
+        with self._locked():
+            manifest = self._readManifest()
+            entry = manifest.pop(key, None)
+            if entry is None:
+                return
+            self._removeUnreferenced(entry['path'], manifest)
+            self._writeManifest(manifest)
+
+
+    def _removeUnreferenced(self, path: str, manifest: dict):
+        """ Delete an object if no manifest entry refers to it """
+        if any(entry['path'] == path for entry in manifest.values()):
+            return
+        with contextlib.suppress(OSError):
+            os.remove(path)
+
+
+    def _evict(self, manifest: dict, keep: str = None):
+        """ Remove least-recently used entries to satisfy maxSize """
+        if self.maxSize is None:
+            return
+        objects = {entry['path']: entry['size'] for entry in manifest.values()}
+        total = sum(objects.values())
+        byAccess = sorted(manifest.items(), key=lambda item: item[1]['atime'])
+        for key, entry in byAccess:
+            if total <= self.maxSize:
+                break
+            if key == keep:
+                continue
+            logger.info(f'Evicting {key} from cache.')
+            del manifest[key]
+            if not any(e['path'] == entry['path'] for e in manifest.values()):
+                total -= objects[entry['path']]
+                self._removeUnreferenced(entry['path'], manifest)
+
+
+    def size(self):
+        """ Total size (bytes) of cached objects """
+        with self._locked():
+            manifest = self._readManifest()
+        return sum({e['path']: e['size'] for e in manifest.values()}.values())
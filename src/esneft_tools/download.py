@@ -1,20 +1,38 @@
 #!/usr/bin/env python
 
+import io
 import os
+import csv
 import sys
 import json
-import glob
 import gzip
 import yaml
+import fnmatch
 import hashlib
+import inspect
 import zipfile
 import logging
 import tempfile
+import shutil
 import pathlib
+import contextlib
+import http.client
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import urllib.error
 import urllib.request
 from datetime import date
+from collections.abc import Mapping
+from concurrent.futures import (
+    ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED)
+from esneft_tools import geometry
+from esneft_tools.cache import dataCache
+from esneft_tools.network import roadNetwork, hasSpatialIndex
 
 
 logger = logging.getLogger(__name__)
@@ -32,9 +50,108 @@ except ModuleNotFoundError:
     logger.error('geopandas not found - some features are unavailable.')
 
 
+class _hashingReader(io.RawIOBase):
+    """ Wrap a binary stream, updating a SHA-256 hash as it is read """
+
+    def __init__(self, fh):
+        self.fh = fh
+        self.hash = hashlib.sha256()
+
+
+    def readable(self):
+        return True
+
+
+    def readinto(self, b):
+        n = self.fh.readinto(b)
+        self.hash.update(memoryview(b)[:n])
+        return n
+
+
+    def hexdigest(self, readSize: int = 1_048_576):
+        """ Consume any unread data and return the final digest """
+        for data in iter(lambda: self.fh.read(readSize), b''):
+            self.hash.update(data)
+        return self.hash.hexdigest()
+
+
+class dataBundle(Mapping):
+    """ Lazy mapping of host datasets, loaded and memoized on access """
+
+    def __init__(self, getData, names: list):
+        self._getData = getData
+        self._names = list(names)
+        self._data = {}
+        self._reads = None
+        self.accessed = {}
+
+
+    def __getitem__(self, name: str):
+        if name not in self._names:
+            raise KeyError(name)
+        if (self._reads is not None) and (name not in self._reads):
+            self._reads.append(name)
+        if name not in self._data:
+            self._data[name] = self._getData.fromHost(name)
+        return self._data[name]
+
+
+    def __contains__(self, name):
+        return name in self._names
+
+
+    def __iter__(self):
+        return iter(self._names)
+
+
+    def __len__(self):
+        return len(self._names)
+
+
+    def __repr__(self):
+        return f'dataBundle(loaded={self.loaded}, available={self._names})'
+
+
+    @property
+    def loaded(self):
+        """ Names of datasets loaded so far """
+        return list(self._data)
+
+
+    def prefetch(self, names: list = None, workers: int = 4):
+        """ Concurrently load datasets that are not yet loaded """
+        names = self._names if names is None else names
+        missing = [name for name in names if name not in self._data]
+        if missing:
+            self._data.update(self._getData.fromHost(missing, workers=workers))
+        return self
+
+
+    def call(self, func, *args, **kwargs):
+        """ Call func, loading only the datasets named in its signature.
+            Datasets read from the bundle during the call are recorded in
+            accessed[func.__name__] """
+        parameters = inspect.signature(func).parameters
+        names = ([
+            name for name in parameters
+            if (name in self._names) and (name not in kwargs)
+        ])
+        outer, self._reads = self._reads, []
+        try:
+            data = {name: self[name] for name in names}
+            return func(*args, **data, **kwargs)
+        finally:
+            reads, self._reads = self._reads, outer
+            if outer is not None:
+                outer.extend(name for name in reads if name not in outer)
+            self.accessed[func.__name__] = reads
+            logger.info(f'{func.__name__} read {", ".join(reads)}')
+
+
 class getData():
 
-    def __init__(self, sourceURL: str = None, cache: str = './.data-cache'):
+    def __init__(self, sourceURL: str = None, cache: str = './.data-cache',
+                 cacheSize: int = None):
         self.cache = cache
         self.host = ('https://raw.githubusercontent.com/'
                      'nhsx/p24-pvt-diabetes-inequal/main/data')
@@ -56,9 +173,14 @@ class getData():
             'LSOAsummary': 'lsoa-summary.parquet',
             'GPsummary': 'gp-summary.parquet'
         })
+        self.geoCache = ({
+            'geoLSOA': 'lsoa-map-esneft.geoparquet'
+        })
         self.observedHashes = {}
+        self.hostErrors = {}
         self.osmnx = 'osmnx' in sys.modules
         os.makedirs(self.cache , exist_ok=True)
+        self.store = dataCache(self.cache, maxSize=cacheSize, hasher=self._getHash)
         logger.info(f'Retrieved files will be cached to {self.cache}')
         # Modify default links if provided
         if sourceURL is not None:
@@ -117,63 +239,208 @@ class getData():
         })
 
 
-    def fromHost(self, name: str):
-        if name == 'all':
-            data = {}
-            for name in self.options:
-                data[name] = self.fromHost(name)
-            return data
-        elif (name == 'esneftOSM') and (not self.osmnx):
+    def fromHost(self, name, columns: list = None, filters: list = None,
+                 lsoa: list = None, workers: int = 4,
+                 osmProcess: bool = False, tier: str = 'full'):
+        if (name == 'all') or isinstance(name, (list, tuple)):
+            names = list(self.options) if name == 'all' else name
+            return self._fromHostConcurrent(names, workers, osmProcess)
+        elif name in self.geoCache:
+            return self._loadGeometry(name, tier)
+        elif ((name == 'esneftOSM') and (not self.osmnx)
+                and (roadNetwork.readMeta(self._getOSMcache()) is None)):
             logger.error(f'OSMNX not installed - skipping {name}.')
             return None
         else:
-            out = f'{self.cache}/{self.options[name]}'
-            if out.endswith('.gz'):
-                out = out[:-3]
-            if os.path.exists(out):
-                logger.info(f'Data already cached - loading from {out}')
-                path = out
-                open_ = open
+            return self._retryEvicted(
+                self._readHost, name, columns, filters, lsoa)
+
+
+    def _readHost(self, name, columns: list = None, filters: list = None,
+                  lsoa: list = None):
+        """ Read a host dataset from cache, fetching on miss """
+        filtered = any(x is not None for x in (columns, filters, lsoa))
+        key, out = self._fromCache(self.options[name])
+        if filtered and not key.endswith('.parquet'):
+            logger.warning(f'Column and row filters ignored for {name}.')
+        if key.endswith('.geojson'):
+            with open(out, encoding='utf-8') as geofile:
+                data = json.load(geofile)
+        elif key.endswith('.parquet'):
+            data = self._readParquet(out, columns, filters, lsoa)
+        elif key.endswith('.json'):
+            try:
+                data = pd.read_json(out)
+            except ValueError:
+                data = pd.read_json(out, typ='series').rename('index')
+        elif key.endswith('.osm'):
+            entry = self.store.entry(key)
+            sourceHash = None if entry is None else entry['sha256']
+            data = self._loadOSM(out, sourceHash)
+        return data
+
+
+    def _retryEvicted(self, load, *args, **kwargs):
+        """ Call load, retrying once if another process evicts its file """
+        try:
+            return load(*args, **kwargs)
+        except FileNotFoundError as exc:
+            logger.warning(
+                f'Cached file removed while reading ({exc}) - retrying.')
+            return load(*args, **kwargs)
+
+
+    def _fromCache(self, file: str):
+        """ Return (key, path) of a verified host file, fetching on miss """
+        key = file[:-3] if file.endswith('.gz') else file
+        out = self.store.get(key)
+        if out is None:
+            out = self._fetchHost(file, key)
+        return key, out
+
+
+    def _fetchHost(self, file: str, key: str):
+        """ Download a host file to a temporary path and commit to cache """
+        url = f'{self.host}/{file}'
+        tmp = self.store.tempPath(''.join(pathlib.Path(key).suffixes))
+        try:
+            if key.endswith('.parquet'):
+                self._writeParquet(pd.read_parquet(url), tmp)
+            elif file.endswith('.gz'):
+                with urllib.request.urlopen(url) as response, \
+                        gzip.open(response) as fh, open(tmp, 'wb') as oh:
+                    shutil.copyfileobj(fh, oh)
             else:
-                path = f'{self.host}/{self.options[name]}'
-                open_ = urllib.request.urlopen
-            if path.endswith('.geojson'):
-                with open_(path) as geofile:
-                    if os.path.exists(out):
-                        data = geofile.read()
-                    else:
-                        data = geofile.read().decode('utf-8')
-                    data = json.loads(data)
-                if not os.path.exists(out):
-                    with open(out, 'w') as fh:
-                        json.dump(data, fh)
-            elif path.endswith('.parquet'):
-                data = pd.read_parquet(path)
-                if not os.path.exists(out):
-                    data.to_parquet(out)
-            elif path.endswith('.json'):
+                sha256 = self._download(url, tmp)
+                return self.store.put(key, tmp, url=url, sha256=sha256)
+            return self.store.put(key, tmp, url=url)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+
+    def _toCache(self, name: str, data, key: str = None):
+        """ Write sourced data to a temporary path and commit to cache """
+        key = self.options[name] if key is None else key
+        tmp = self.store.tempPath(''.join(pathlib.Path(key).suffixes))
+        try:
+            if key.endswith('.parquet'):
+                self._writeParquet(data, tmp)
+            else:
+                with open(tmp, 'w') as fh:
+                    json.dump(data, fh)
+            return self.store.put(key, tmp, url=self.sourceURL.get(name))
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+
+    def _loadGeometry(self, name: str, tier: str = 'full'):
+        """ Load GeoJSON at a simplification tier from the geometry cache """
+        return self._retryEvicted(self._readGeometry, name, tier)
+
+
+    def _readGeometry(self, name: str, tier: str = 'full'):
+        geometry._tierColumn(tier)
+        if 'shapely' not in sys.modules:
+            # Without shapely only the full-resolution GeoJSON is available
+            if tier != 'full':
+                geometry.requireShapely(f'the {tier} geometry tier')
+            _, path = self._fromCache(self.options[name])
+            with open(path, encoding='utf-8') as geofile:
+                return json.load(geofile)
+        out = self.store.get(self.geoCache[name])
+        if out is None:
+            key, path = self._fromCache(self.options[name])
+            with open(path, encoding='utf-8') as geofile:
+                geojson = json.load(geofile)
+            out = self._toGeoCache(name, *geometry.fromGeoJSON(geojson))
+            # Raw GeoJSON is not needed once the geometry cache is built
+            self.store.remove(key)
+        return geometry.readGeoJSON(out, tier)
+
+
+    def _toGeoCache(self, name: str, ids, properties, geometries):
+        """ Write geometry tiers as GeoParquet and commit to cache """
+        tmp = self.store.tempPath('.geoparquet')
+        try:
+            geometry.writeGeoParquet(tmp, ids, properties, geometries)
+            return self.store.put(
+                self.geoCache[name], tmp, url=self.sourceURL.get(name))
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+
+    def _loadOSM(self, path: str, sourceHash: str = None):
+        """ Load road network from compact cache or build from OSM XML """
+        if sourceHash is None:
+            sourceHash = self._getHash([path], readSize=1_048_576)
+        csr = self._getOSMcache()
+        meta = roadNetwork.readMeta(csr)
+        if (meta is not None) and (meta['sourceHash'] == sourceHash):
+            logger.info(f'Loading cached road network from {csr}')
+            return roadNetwork.load(csr)
+        elif not self.osmnx:
+            logger.error(f'OSMNX not installed - cannot build {path}.')
+            return None
+        logger.info(f'Building road network from {path}')
+        G = ox.graph.graph_from_xml(path, simplify=True)
+        # Get largest connected to prevent no pathing
+        G = ox.utils_graph.get_largest_component(G)
+        # Convert node names to string to prevent integer overflow
+        relabel = {node: str(node) for node in G.nodes}
+        G = nx.relabel_nodes(G, relabel)
+        data = roadNetwork.fromGraph(G)
+        data.save(csr, sourceHash)
+        return data
+
+
+    def lazy(self, names='all'):
+        """ Return a lazy dataBundle that loads datasets on first access """
+        names = list(self.options) if names == 'all' else names
+        return dataBundle(self, names)
+
+
+    def _fromHostConcurrent(self, names: list, workers: int = 4,
+                            osmProcess: bool = False):
+        """ Retrieve several datasets concurrently with a worker pool """
+        names = list(dict.fromkeys(names))
+        osmProcess = osmProcess and ('esneftOSM' in names)
+        self.hostErrors = {}
+        futures = {}
+        with contextlib.ExitStack() as stack:
+            threads = stack.enter_context(
+                ThreadPoolExecutor(max_workers=workers))
+            if osmProcess:
+                processes = stack.enter_context(
+                    ProcessPoolExecutor(max_workers=1))
+            for name in names:
+                if osmProcess and (name == 'esneftOSM'):
+                    # Build the road network cache outside of the GIL
+                    futures[name] = processes.submit(self._prepareOSM)
+                else:
+                    futures[name] = threads.submit(self.fromHost, name)
+            data = {}
+            for name, future in futures.items():
                 try:
-                    data = pd.read_json(path)
-                except ValueError:
-                    data = pd.read_json(path, typ='series').rename('index')
-                if not os.path.exists(out):
-                    data.to_json(out)
-            elif path.endswith('.osm.gz') or path.endswith('.osm'):
-                if path.endswith('.osm.gz'):
-                    with open_(path) as osm:
-                        with gzip.open(osm, 'rt') as fh, open(out, 'w') as oh:
-                            for line in fh:
-                                oh.write(line)
-                data = ox.graph.graph_from_xml(out, simplify=True)
-                # Get largest connected to prevent no pathing
-                data = ox.utils_graph.get_largest_component(data)
-                # Convert node names to string to prevent integer overflow
-                relabel = {node: str(node) for node in data.nodes}
-                data = nx.relabel_nodes(data, relabel)
-            return data
-
-
-    def fromSource(self, name: str):
+                    data[name] = future.result()
+                    if osmProcess and (name == 'esneftOSM'):
+                        # Memory-map the cache rather than unpickle arrays
+                        data[name] = self.fromHost(name)
+                except Exception as exc:
+                    logger.error(f'Failed to retrieve {name}: {exc}')
+                    self.hostErrors[name] = exc
+                    data[name] = None
+        return data
+
+
+    def _prepareOSM(self):
+        """ Download and cache the road network without returning it """
+        self.fromHost('esneftOSM')
+
+
+    def fromSource(self, name: str, **kwargs):
         """ Call function according to input """
         sourceMap = ({
             'postcodeLSOA': self._sourceLSOA,
@@ -187,31 +454,43 @@ class getData():
             'qof': self._sourceQOF,
             'geoLSOA': self._sourceMap,
         })
-        data = sourceMap[name]()
+        data = sourceMap[name](**kwargs)
         return data
 
 
-    def getSummary(self, name: str):
+    def getSummary(self, name: str, columns: list = None,
+                   filters: list = None, lsoa: list = None):
         """ Retrive LSOA or GP summarised data from host """
-        out = f'{self.cache}/{self.summary[name]}'
-        if os.path.exists(out):
-            logger.info(f'Data already cached - loading from {out}')
-            path = out
-            open_ = open
-        else:
-            path = f'{self.host}/{self.summary[name]}'
-            open_ = urllib.request.urlopen
-        data = pd.read_parquet(path)
-        if not os.path.exists(out):
-            data.to_parquet(out)
-        return data
+        return self._retryEvicted(
+            lambda: self._readParquet(
+                self._fromCache(self.summary[name])[1], columns, filters, lsoa))
+
+
+    def _writeParquet(self, data, path: str, rowGroupSize: int = 20_000):
+        """ Write parquet sorted and row-grouped by LSOA when available """
+        if 'LSOA11CD' in data.columns:
+            data = data.sort_values('LSOA11CD', kind='stable')
+        elif data.index.name == 'LSOA11CD':
+            data = data.sort_index(kind='stable')
+        data.to_parquet(path, row_group_size=rowGroupSize)
 
 
-    def _getSourcePath(self, name: str):
-        return f'{self.cache}/{self.options[name]}'
+    def _readParquet(self, path: str, columns: list = None,
+                     filters: list = None, lsoa: list = None):
+        """ Read parquet with column projection and row-group filtering """
+        filters = [] if filters is None else list(filters)
+        if lsoa is not None:
+            filters.append(('LSOA11CD', 'in', list(lsoa)))
+        return pd.read_parquet(
+            path, columns=columns, filters=(filters if filters else None))
 
 
-    def _getHash(self, files, readSize: int = 4096):
+    def _getOSMcache(self):
+        """ Path to the compact road network cache """
+        return f'{self.cache}/esneft-highways.csr'
+
+
+    def _getHash(self, files, readSize: int = 1_048_576):
         sha256Hash = hashlib.sha256()
         for file in files:
             with open(file, 'rb') as f:
@@ -223,8 +502,12 @@ class getData():
         return hash
 
 
-    def _verifyHash(self, name, files: list, readSize: int = 4096):
-        self.observedHashes[name] = self._getHash(files, readSize)
+    def _verifyHash(self, name, files: list, readSize: int = 1_048_576):
+        return self._checkHash(name, self._getHash(files, readSize))
+
+
+    def _checkHash(self, name: str, observed: str):
+        self.observedHashes[name] = observed
         logger.info(f'Verifying hash of {name} ...')
         if self.observedHashes[name] == self.expectedHashes[name]:
             logger.info('... hash verification successful.')
@@ -234,40 +517,177 @@ class getData():
             return 1
 
 
-    def _sourceLSOA(self):
-        name = 'NSPL21_NOV_2022_UK.csv'
+    def _download(self, url: str, path: str, name: str = None,
+                  headers: dict = None, readSize: int = 1_048_576,
+                  retries: int = 3):
+        """ Stream url to path, hashing inline and resuming on failure """
+        sha256Hash = hashlib.sha256()
+        written = 0
+        for attempt in range(retries + 1):
+            request = urllib.request.Request(url, headers=(headers or {}))
+            if written:
+                request.add_header('Range', f'bytes={written}-')
+            try:
+                with urllib.request.urlopen(request) as response:
+                    if written and (response.status != 206):
+                        # Server ignored the range request - start again
+                        sha256Hash = hashlib.sha256()
+                        written = 0
+                    expected = response.headers.get('Content-Length')
+                    received = 0
+                    with open(path, 'ab' if written else 'wb') as fh:
+                        # Track progress per block so an interrupted read
+                        # resumes from exactly what was written and hashed
+                        for data in iter(lambda: response.read(readSize), b''):
+                            fh.write(data)
+                            sha256Hash.update(data)
+                            received += len(data)
+                            written += len(data)
+                    if (expected is not None) and (received < int(expected)):
+                        raise http.client.IncompleteRead(
+                            b'', int(expected) - received)
+                break
+            except urllib.error.HTTPError:
+                raise
+            except (urllib.error.URLError, http.client.HTTPException,
+                    ConnectionError, TimeoutError) as exc:
+                if attempt == retries:
+                    raise
+                logger.warning(
+                    f'Download interrupted after {written} bytes ({exc}) - '
+                    f'resuming {url}')
+        hash = sha256Hash.hexdigest()
+        if name is not None:
+            self._checkHash(name, hash)
+        return hash
+
+
+    @contextlib.contextmanager
+    def _openMember(self, zipRef, member: str, name: str,
+                    readSize: int = 1_048_576):
+        """ Stream a zip member, verifying its hash as it is read """
+        with zipRef.open(member) as fh:
+            reader = _hashingReader(fh)
+            yield io.BufferedReader(reader, buffer_size=readSize)
+            self._checkHash(name, reader.hexdigest(readSize))
+
+
+    def _findMember(self, zipRef, pattern: str):
+        """ Return first zip member matching a glob pattern """
+        return fnmatch.filter(zipRef.namelist(), pattern)[0]
+
+
+    def _sourceLSOA(self, blockSize: int = 16_777_216):
+        name = 'Data/NSPL21_NOV_2022_UK.csv'
         url = self.sourceURL['postcodeLSOA']
+        esneftLSOA = self.fromHost('esneftLSOA')
+        G = self.fromHost('esneftOSM')
+        if (G is not None) and (not hasSpatialIndex()):
+            logger.warning('scipy not found - skipping nearest road node lookup.')
+            G = None
         logger.info(f'Downloading LSOA lookup from {url}')
-        path = self._getSourcePath('postcodeLSOA')
-        with tempfile.TemporaryDirectory() as tmp:
-            urllib.request.urlretrieve(url, f'{tmp}/data.zip')
-            with zipfile.ZipFile(f'{tmp}/data.zip', 'r') as zipRef:
-                zipRef.extractall(f'{tmp}/')
-            dtype = ({
-                'PCDS'    : str, # PCDS - Postcode
-                'LSOA11CD': str, # LSOA Code (Census 2011)
-                'Lat'     : float,
-                'Long'    : float
-            })
-            cols = [2, 25, 33, 34]
-            self._verifyHash('postcodeLSOA', [f'{tmp}/Data/{name}'])
-            postcodeLSOA = pd.read_csv(
-                f'{tmp}/Data/{name}', usecols=cols, names=dtype.keys(), dtype=dtype,
-                skiprows=1, sep=',', encoding='latin-1')
+        dtype = ({
+            'PCDS'    : pa.string(), # PCDS - Postcode
+            'LSOA11CD': pa.string(), # LSOA Code (Census 2011)
+            'Lat'     : pa.float64(),
+            'Long'    : pa.float64()
+        })
+        cols = [2, 25, 33, 34]
+        schema = pa.schema(
+            [*dtype.items(), ('ESNEFT', pa.bool_())]
+            + ([('Node', pa.string())] if G is not None else []))
+        path = self.store.tempPath('.parquet')
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                self._download(url, f'{tmp}/data.zip')
+                with zipfile.ZipFile(f'{tmp}/data.zip', 'r') as zipRef:
+                    # Map column positions to header names for projection
+                    with zipRef.open(name) as fh:
+                        header = next(csv.reader(
+                            io.TextIOWrapper(fh, encoding='latin-1')))
+                    names = {header[i]: col for i, col in zip(cols, dtype)}
+                    readOptions = pacsv.ReadOptions(
+                        block_size=blockSize, encoding='latin-1')
+                    convertOptions = pacsv.ConvertOptions(
+                        include_columns=list(names),
+                        strings_can_be_null=True,
+                        column_types={
+                            source: dtype[col] for source, col in names.items()})
+                    writer = None
+                    with self._openMember(zipRef, name, 'postcodeLSOA') as fh:
+                        reader = pacsv.open_csv(
+                            fh, read_options=readOptions,
+                            convert_options=convertOptions)
+                        try:
+                            for batch in reader:
+                                chunk = self._processLSOA(
+                                    batch.to_pandas().rename(names, axis=1),
+                                    esneftLSOA, G)
+                                table = pa.Table.from_pandas(
+                                    chunk, schema=schema, preserve_index=True)
+                                if writer is None:
+                                    writer = pq.ParquetWriter(
+                                        f'{tmp}/unsorted.parquet', table.schema)
+                                writer.write_table(table)
+                        finally:
+                            if writer is not None:
+                                writer.close()
+                # NSPL is ordered by postcode - sort by LSOA so row groups
+                # cover narrow LSOA ranges and lsoa= filters can skip them
+                self._sortParquet(f'{tmp}/unsorted.parquet', path, 'LSOA11CD')
+            postcodeLSOA = pd.read_parquet(path)
+            logger.info('Writing Postcode: LSOA map to cache')
+            self.store.put(self.options['postcodeLSOA'], path, url=url)
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+        return postcodeLSOA
+
+
+    def _sortParquet(self, path: str, out: str, column: str,
+                     bucketRows: int = 1_000_000, rowGroupSize: int = 20_000):
+        """ Rewrite parquet (stable) sorted by column, one key range at a time
+
+        Key ranges are chosen from the column values so that each holds
+        roughly bucketRows rows; only one range is held in memory.
+        """
+        dataset = ds.dataset(path, format='parquet')
+        counts = dataset.to_table(columns=[column])[column].value_counts()
+        counts = pd.Series(
+            counts.field('counts').to_numpy(),
+            index=counts.field('values').to_pandas())
+        nulls = counts.loc[counts.index.isna()].sum()
+        counts = counts.loc[counts.index.notna()].sort_index()
+        # Assign each key to a bucket of consecutive keys
+        bucket = (counts.cumsum() - counts) // bucketRows
+        field = pc.field(column)
+        filters = ([
+            (field >= keys.index[0]) & (field <= keys.index[-1])
+            for _, keys in counts.groupby(bucket.to_numpy())
+        ])
+        if nulls:
+            filters.append(field.is_null())
+        with pq.ParquetWriter(out, dataset.schema) as writer:
+            for expression in filters:
+                table = dataset.to_table(filter=expression)
+                if table.num_rows:
+                    table = table.sort_by(column)
+                writer.write_table(table, row_group_size=rowGroupSize)
+
+
+    def _processLSOA(self, postcodeLSOA, esneftLSOA, G=None):
+        """ Flag ESNEFT postcodes and assign their nearest road node """
         postcodeLSOA = postcodeLSOA.set_index('PCDS')
-        esneftLSOA = self.fromHost('esneftLSOA')
         postcodeLSOA['ESNEFT'] = postcodeLSOA['LSOA11CD'].isin(esneftLSOA)
-        G = self.fromHost('esneftOSM')
         if G is not None:
             # Get rows in ESNEFT with Lat Long
             valid = (postcodeLSOA['ESNEFT']
                      & postcodeLSOA[['Lat', 'Long']].notna().all(axis=1))
-            postcodeLSOA.loc[valid, 'Node'] = (
-                ox.distance.nearest_nodes(G,
-                    postcodeLSOA.loc[valid, 'Long'],
-                    postcodeLSOA.loc[valid, 'Lat']))
-        logger.info(f'Writing Postcode: LSOA map to {path}')
-        postcodeLSOA.to_parquet(path)
+            postcodeLSOA['Node'] = pd.Series(
+                None, index=postcodeLSOA.index, dtype=object)
+            postcodeLSOA.loc[valid, 'Node'] = G.nearestNodes(
+                postcodeLSOA.loc[valid, 'Lat'],
+                postcodeLSOA.loc[valid, 'Long'])
         return postcodeLSOA
 
 
@@ -304,74 +724,82 @@ class getData():
             0, 1, 4, 7, 10, 13, 16, 19, 22, 25, 28, 31,
             34, 37, 40, 43, 46, 49, 52, 53, 54, 55, 56
         ])
-        path = self._getSourcePath('imdLSOA')
         with tempfile.TemporaryDirectory() as tmp:
-            urllib.request.urlretrieve(url, f'{tmp}/{name}')
-            self._verifyHash('imdLSOA', [f'{tmp}/{name}'])
+            self._download(url, f'{tmp}/{name}', name='imdLSOA')
             imdLSOA = pd.read_csv(
                 f'{tmp}/{name}', usecols=cols, names=dtype.keys(),
                 dtype=dtype, skiprows=1, sep=',').set_index('LSOA11CD')
-        imdLSOA.to_parquet(path)
+        self._toCache('imdLSOA', imdLSOA)
         return imdLSOA
 
 
     def _sourcePopulation(self):
         name = 'SAP23DT2-mid2020-LSOA.xlsx'
         url = self.sourceURL['populationLSOA']
-        headers = [(
-            'Accept',
+        headers = ({
+            'Accept':
             'text/html,application/xhtml+xml,application/xml;'
             'q=0.9,image/avif,image/webp,*/*;q=0.8'
-        )]
-        path = self._getSourcePath('populationLSOA')
+        })
         with tempfile.TemporaryDirectory() as tmp:
-            opener = urllib.request.build_opener()
-            opener.addheaders = headers
-            urllib.request.install_opener(opener)
-            urllib.request.urlretrieve(url, f'{tmp}/{name}')
-            self._verifyHash('populationLSOA', [f'{tmp}/{name}'])
+            self._download(
+                url, f'{tmp}/{name}', name='populationLSOA', headers=headers)
             populationLSOA = pd.concat([
                 self._processPopulationSheet(f'{tmp}/{name}', 'Male'),
                 self._processPopulationSheet(f'{tmp}/{name}', 'Female'),
             ])
-        populationLSOA.to_parquet(path)
+        self._toCache('populationLSOA', populationLSOA)
         return populationLSOA
 
 
-    def _sourceEthnicity(self):
+    def _sourceEthnicity(self, workers: int = 8, pageSize: int = 24000):
         url = self.sourceURL['ethnicityLSOA']
         logger.info(f'Downloading Ethnicity by LSOA from {url}')
         url += '&RecordOffset={}' # API called in increments due to size limit
-        path = self._getSourcePath('ethnicityLSOA')
         ethnicityLSOA = []
+        futures = {}
         offset = 0
-        while True:
-            with tempfile.TemporaryDirectory() as tmp:
-                urllib.request.urlretrieve(url.format(offset), f'{tmp}/data.csv')
-                dtype = {'LSOA11CD': str, 'Ethnicity': str, 'Count': int}
-                data = pd.read_csv(
-                    f'{tmp}/data.csv',
-                    names=dtype.keys(), dtype=dtype, skiprows=1)
-                if data.empty:
-                    break
-                ethnicityLSOA.append(data)
-            offset += 24000
+        complete = False
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # Keep a bounded number of pages in flight until one is empty
+            while futures or not complete:
+                while (not complete) and (len(futures) < workers):
+                    futures[pool.submit(
+                        self._fetchEthnicityPage, url.format(offset))] = offset
+                    offset += pageSize
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    del futures[future]
+                    data = future.result()
+                    if data.empty:
+                        complete = True
+                    else:
+                        ethnicityLSOA.append(data)
         ethnicityLSOA = (
-                pd.concat(ethnicityLSOA)
-                .drop_duplicates()
-                .groupby('LSOA11CD')
-                .apply(self._getEthnicMinority)
-                .rename('EthnicMinority')
-                .to_frame())
-        ethnicityLSOA.to_parquet(path)
+            self._getEthnicMinority(
+                pd.concat(ethnicityLSOA).drop_duplicates())
+            .rename('EthnicMinority')
+            .to_frame())
+        self._toCache('ethnicityLSOA', ethnicityLSOA)
         return ethnicityLSOA
 
 
-    def _getEthnicMinority(self, x):
-        """ Get proportion of non-white residents """
-        total = x['Count'].sum()
-        nonwhite = x.loc[x['Ethnicity'] != 'White', 'Count'].sum()
-        return nonwhite / total
+    def _fetchEthnicityPage(self, url: str):
+        """ Retrieve one page of the NOMIS API into memory """
+        with urllib.request.urlopen(url) as response:
+            page = response.read()
+        dtype = {'LSOA11CD': str, 'Ethnicity': str, 'Count': int}
+        return pd.read_csv(
+            io.BytesIO(page), names=dtype.keys(), dtype=dtype, skiprows=1)
+
+
+    def _getEthnicMinority(self, data):
+        """ Get proportion of non-white residents per LSOA """
+        nonwhite = data['Count'].where(data['Ethnicity'] != 'White', 0)
+        counts = (
+            data[['LSOA11CD', 'Count']].assign(nonwhite=nonwhite)
+            .groupby('LSOA11CD').sum())
+        return counts['nonwhite'] / counts['Count']
 
 
     def _processPopulationSheet(self, path: str, sex: str):
@@ -393,37 +821,33 @@ class getData():
     def _sourceArea(self):
         url = self.sourceURL['areaLSOA']
         logger.info(f'Downloading LSOA land area lookup from {url}')
-        path = self._getSourcePath('areaLSOA')
         with tempfile.TemporaryDirectory() as tmp:
-            urllib.request.urlretrieve(url, f'{tmp}/data.zip')
-            with zipfile.ZipFile(f'{tmp}/data.zip', 'r') as zipRef:
-                zipRef.extractall(f'{tmp}/')
+            self._download(url, f'{tmp}/data.zip')
             dtype = ({
                 'LSOA11CD'   : str,
                 'LandHectare': float,
 
             })
             cols = [0, 3]
-            file = glob.glob(f'{tmp}/*/Measurements/SAM_LSOA_*_*_EW.csv')[0]
-            self._verifyHash('areaLSOA', [file])
-            areaLSOA = (
-                pd.read_csv(
-                    file, encoding='latin-1', skiprows=1,
-                    usecols=cols, dtype=dtype, names=dtype.keys()
-                ).set_index('LSOA11CD')
-            )
-        areaLSOA.to_parquet(path)
+            with zipfile.ZipFile(f'{tmp}/data.zip', 'r') as zipRef:
+                file = self._findMember(
+                    zipRef, '*/Measurements/SAM_LSOA_*_*_EW.csv')
+                with self._openMember(zipRef, file, 'areaLSOA') as fh:
+                    areaLSOA = (
+                        pd.read_csv(
+                            fh, encoding='latin-1', skiprows=1,
+                            usecols=cols, dtype=dtype, names=dtype.keys()
+                        ).set_index('LSOA11CD')
+                    )
+        self._toCache('areaLSOA', areaLSOA)
         return areaLSOA
 
 
     def _sourceGPregistration(self):
         url = self.sourceURL['gpRegistration']
         logger.info(f'Downloading GP registration lookup from {url}')
-        path = self._getSourcePath('gpRegistration')
         with tempfile.TemporaryDirectory() as tmp:
-            urllib.request.urlretrieve(url, f'{tmp}/data.zip')
-            with zipfile.ZipFile(f'{tmp}/data.zip', 'r') as zipRef:
-                zipRef.extractall(f'{tmp}/')
+            self._download(url, f'{tmp}/data.zip')
             dtype = ({
                 'OrganisationCode': str,
                 'OranisationName' : str,
@@ -431,23 +855,21 @@ class getData():
                 'Patient'         : int,
             })
             cols = [2, 3, 4, 6]
-            self._verifyHash(
-                'gpRegistration', [f'{tmp}/gp-reg-pat-prac-lsoa-all.csv'])
-            gpRegistration = pd.read_csv(
-                f'{tmp}/gp-reg-pat-prac-lsoa-all.csv', skiprows=1,
-                usecols=cols, dtype=dtype, names=dtype.keys())
-        gpRegistration.to_parquet(path)
+            with zipfile.ZipFile(f'{tmp}/data.zip', 'r') as zipRef, \
+                    self._openMember(zipRef, 'gp-reg-pat-prac-lsoa-all.csv',
+                                     'gpRegistration') as fh:
+                gpRegistration = pd.read_csv(
+                    fh, skiprows=1, usecols=cols, dtype=dtype,
+                    names=dtype.keys())
+        self._toCache('gpRegistration', gpRegistration)
         return gpRegistration
 
 
     def _sourceGPpractice(self):
         url = self.sourceURL['gpPractice']
         logger.info(f'Downloading GP practice lookup from {url}')
-        path = self._getSourcePath('gpPractice')
         with tempfile.TemporaryDirectory() as tmp:
-            urllib.request.urlretrieve(url, f'{tmp}/data.zip')
-            with zipfile.ZipFile(f'{tmp}/data.zip', 'r') as zipRef:
-                zipRef.extractall(f'{tmp}/')
+            self._download(url, f'{tmp}/data.zip')
             dtype = ({
                 'OrganisationCode'  : str,
                 'OrganisationName'  : str,
@@ -458,10 +880,11 @@ class getData():
                 'PrescribingSetting': int
             })
             cols = [0, 1, 9, 10, 11, 12, 25]
-            self._verifyHash('gpPractice', [f'{tmp}/epraccur.csv'])
-            gpPractices = pd.read_csv(
-                f'{tmp}/epraccur.csv', usecols=cols, names=dtype.keys(),
-                dtype=dtype, sep=',', encoding='latin-1')
+            with zipfile.ZipFile(f'{tmp}/data.zip', 'r') as zipRef, \
+                    self._openMember(zipRef, 'epraccur.csv', 'gpPractice') as fh:
+                gpPractices = pd.read_csv(
+                    fh, usecols=cols, names=dtype.keys(),
+                    dtype=dtype, sep=',', encoding='latin-1')
         statusMap = ({
             'A': 'Active',
             'C': 'Closed',
@@ -488,35 +911,40 @@ class getData():
         gpPractices['PrescribingSetting'] = (
             gpPractices['PrescribingSetting'].replace(prescribingSetting))
         gpPractices = gpPractices.set_index('OrganisationCode')
-        logger.info(f'Writing GP practice lookup to {path}')
-        gpPractices.to_parquet(path)
+        logger.info('Writing GP practice lookup to cache')
+        self._toCache('gpPractice', gpPractices)
         return gpPractices
 
 
-    def _summariseStaff(self, x):
+    def _summariseStaff(self, gpStaff):
         """ Compute aggregate staff stats per practice """
-        active = x['Left'].isna().any()
-        start = pd.Timestamp(x['Joined'].min())
-        end = pd.Timestamp(date.today()) if active else x['Left'].max()
-        totalYears = ((end - start).days / 365.25)
-
-        currentStaff = x['Current'].sum()
-        leftStaff = (x['Left'] < end).sum()
-
-        meanStaff = (x['Left'] - x['Joined']).dt.days.sum() / (end - start).days
-        turnOver = ((leftStaff / meanStaff) / totalYears) * 100
-
-        return pd.Series([currentStaff, leftStaff, meanStaff, turnOver])
-
-
-    def _sourceGPstaff(self):
+        # Day offsets relative to the (filled) latest leaving date
+        gpStaff = gpStaff.assign(
+            left=(gpStaff['Left'] - gpStaff['Left'].max()).dt.days,
+            joined=(gpStaff['Joined'] - gpStaff['Left'].max()).dt.days)
+        end = gpStaff.groupby('OrganisationCode')['left'].transform('max')
+        gpStaff['departed'] = gpStaff['left'] < end
+        gpStaff['served'] = gpStaff['left'] - gpStaff['joined']
+        summary = gpStaff.groupby('OrganisationCode').agg(
+            currentStaff=('Current', 'sum'),
+            departedStaff=('departed', 'sum'),
+            served=('served', 'sum'),
+            start=('joined', 'min'),
+            end=('left', 'max')).astype(float)
+        days = summary['end'] - summary['start']
+        totalYears = days / 365.25
+        summary['meanStaff'] = summary['served'] / days
+        summary['annualStaffTurnover'] = (
+            ((summary['departedStaff'] / summary['meanStaff']) / totalYears) * 100)
+        return summary[[
+            'currentStaff', 'departedStaff', 'meanStaff', 'annualStaffTurnover']]
+
+
+    def _sourceGPstaff(self, referenceDate=None):
         url = self.sourceURL['gpStaff']
         logger.info(f'Downloading GP staff lookup from {url}')
-        path = self._getSourcePath('gpStaff')
         with tempfile.TemporaryDirectory() as tmp:
-            urllib.request.urlretrieve(url, f'{tmp}/data.zip')
-            with zipfile.ZipFile(f'{tmp}/data.zip', 'r') as zipRef:
-                zipRef.extractall(f'{tmp}/')
+            self._download(url, f'{tmp}/data.zip')
             dtype = ({
                 'PractionerCode'  : str,
                 'OrganisationCode': str,
@@ -524,175 +952,117 @@ class getData():
                 'Left'            : str,
             })
             cols = [0, 1, 3, 4]
-            self._verifyHash('gpStaff', [f'{tmp}/epracmem.csv'])
-            gpStaff = pd.read_csv(
-                f'{tmp}/epracmem.csv', usecols=cols,
-                names=dtype.keys(), dtype=dtype, sep=',')
+            with zipfile.ZipFile(f'{tmp}/data.zip', 'r') as zipRef, \
+                    self._openMember(zipRef, 'epracmem.csv', 'gpStaff') as fh:
+                gpStaff = pd.read_csv(
+                    fh, usecols=cols, names=dtype.keys(), dtype=dtype, sep=',')
         gpStaff['Joined'] = pd.to_datetime(gpStaff['Joined'], format="%Y/%m/%d")
         gpStaff['Left'] = pd.to_datetime(gpStaff['Left'], format="%Y/%m/%d")
         gpStaff['Current'] = gpStaff['Left'].isna()
-        gpStaff['Left'] = gpStaff['Left'].apply(
-            lambda x: pd.to_datetime(date.today()) if pd.isnull(x) else x)
-        names = ({
-            0: 'currentStaff',
-            1: 'departedStaff',
-            2: 'meanStaff',
-            3: 'annualStaffTurnover'
-        })
-        gpStaff = (
-            gpStaff.groupby('OrganisationCode').apply(self._summariseStaff)
-            .rename(names, axis=1))
-        logger.info(f'Writing GP staff stats to {path}')
-        gpStaff.to_parquet(path)
+        # Current staff are treated as leaving on the reference date
+        if referenceDate is None:
+            referenceDate = date.today()
+        gpStaff['Left'] = gpStaff['Left'].fillna(pd.Timestamp(referenceDate))
+        gpStaff = self._summariseStaff(gpStaff)
+        logger.info('Writing GP staff stats to cache')
+        self._toCache('gpStaff', gpStaff)
         return gpStaff
 
 
-    def _sourceQOF(self):
-        path = self._getSourcePath('qof')
-        qof = pd.concat([
-            self._sourceQOFhd(), self._sourceQOFcv(),
-            self._sourceQOFres(), self._sourceQOFls(),
-            self._sourceQOFmh()], axis=1)
-        logger.info(f'Writing QOF data to {path}')
-        qof.to_parquet(path)
+    def _sourceQOF(self, workers: int = None):
+        # Parse each workbook in a separate process (default one per CPU)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = ({
+                name: pool.submit(self._sourceQOFworkbook, name)
+                for name in self._QOFworkbooks
+            })
+            qof = []
+            for name, future in futures.items():
+                data, self.observedHashes[name] = future.result()
+                qof.append(data)
+        qof = pd.concat(qof, axis=1)
+        logger.info('Writing QOF data to cache')
+        self._toCache('qof', qof)
         return qof
 
 
-    def _sourceQOFhd(self):
-        url = self.sourceURL['qofHD']
-        logger.info(f'Downloading QOF 2020/2021 High Dep data from {url}')
-        qofHD = []
-        with tempfile.TemporaryDirectory() as tmp:
-            urllib.request.urlretrieve(url, f'{tmp}/data.xlsx')
-            self._verifyHash('qofHD', [f'{tmp}/data.xlsx'])
-            for sheet in ['DM', 'CAN', 'CKD', 'NDH', 'PC']:
-                names = ({
-                    'OrganisationCode': str,
-                    'Registered': int,
-                    sheet: int,
-                })
-                cols = [5] + self._QOFsheet(sheet)
-                if sheet == 'DM':
-                    extra = ({
-                        'QOF-DM': float,
-                        'DM019-num': int, 'DM019-den': int,
-                        'DM020-num': int, 'DM020-den': int,
-                    })
-                    names = {**names, **extra}
-                    cols += [17, 54, 59, 62, 67]
-                qof = pd.read_excel(
-                    f'{tmp}/data.xlsx', names=names.keys(), dtype=names,
-                    usecols=cols, skiprows=11, nrows=6470,
-                    sheet_name=sheet).set_index('OrganisationCode')
-                qof[f'{sheet}-prevalance'] = qof[sheet] / qof['Registered']
-                if sheet == 'DM':
-                    qof['DM019-BP'] = qof['DM019-num'] / qof['DM019-den']
-                    qof['DM020-HbA1c'] = qof['DM020-num'] / qof['DM020-den']
-                    colAppend = ([
-                        'QOF-DM', 'DM019-BP', 'DM020-HbA1c',
-                        f'{sheet}-prevalance'
-                    ])
-                else:
-                    colAppend = f'{sheet}-prevalance'
-                qofHD.append(qof[colAppend])
-        qofHD = pd.concat(qofHD, axis=1)
-        return qofHD
+    @property
+    def _QOFworkbooks(self):
+        """ Map QOF workbook to its disease register sheets """
+        return ({
+            'qofHD': ['DM', 'CAN', 'CKD', 'NDH', 'PC'],
+            'qofCV': ['AF', 'CHD', 'HF', 'HYP', 'LVSD', 'PAD', 'STIA'],
+            'qofRES': ['AST', 'COPD'],
+            'qofLS': ['OB', 'SMOK'],
+            'qofMH': ['DEM', 'DEP', 'EP', 'LD', 'MH'],
+        })
 
 
-    def _sourceQOFcv(self):
-        url = self.sourceURL['qofCV']
-        logger.info(f'Downloading QOF 2020/2021 CV data from {url}')
-        qofCV = []
-        with tempfile.TemporaryDirectory() as tmp:
-            urllib.request.urlretrieve(url, f'{tmp}/data.xlsx')
-            self._verifyHash('qofCV', [f'{tmp}/data.xlsx'])
-            for sheet in ['AF', 'CHD', 'HF', 'HYP', 'LVSD', 'PAD', 'STIA']:
-                names = ({
-                    'OrganisationCode': str,
-                    'Registered': int,
-                    sheet: int,
-                })
-                cols = [5] + self._QOFsheet(sheet)
-                qof = pd.read_excel(
-                    f'{tmp}/data.xlsx', names=names.keys(), dtype=names,
-                    usecols=cols, skiprows=11, nrows=6470,
-                    sheet_name=sheet).set_index('OrganisationCode')
-                qof[f'{sheet}-prevalance'] = qof[sheet] / qof['Registered']
-                qofCV.append(qof[f'{sheet}-prevalance'])
-        qofCV = pd.concat(qofCV, axis=1)
-        return qofCV
-
-
-    def _sourceQOFres(self):
-        url = self.sourceURL['qofRES']
-        logger.info(f'Downloading QOF 2020/2021 Res data from {url}')
-        qofRes = []
-        with tempfile.TemporaryDirectory() as tmp:
-            urllib.request.urlretrieve(url, f'{tmp}/data.xlsx')
-            self._verifyHash('qofRES', [f'{tmp}/data.xlsx'])
-            for sheet in ['AST', 'COPD']:
-                names = ({
-                    'OrganisationCode': str,
-                    'Registered': int,
-                    sheet: int,
-                })
-                cols = [5] + self._QOFsheet(sheet)
-                qof = pd.read_excel(
-                    f'{tmp}/data.xlsx', names=names.keys(), dtype=names,
-                    usecols=cols, skiprows=11, nrows=6470,
-                    sheet_name=sheet).set_index('OrganisationCode')
-                qof[f'{sheet}-prevalance'] = qof[sheet] / qof['Registered']
-                qofRes.append(qof[f'{sheet}-prevalance'])
-        qofRes = pd.concat(qofRes, axis=1)
-        return qofRes
-
-
-    def _sourceQOFls(self):
-        url = self.sourceURL['qofLS']
-        logger.info(f'Downloading QOF 2020/2021 LS data from {url}')
-        qofLS = []
-        with tempfile.TemporaryDirectory() as tmp:
-            urllib.request.urlretrieve(url, f'{tmp}/data.xlsx')
-            self._verifyHash('qofLS', [f'{tmp}/data.xlsx'])
-            for sheet in ['OB', 'SMOK']:
-                names = ({
-                    'OrganisationCode': str,
-                    'Registered': int,
-                    sheet: int,
-                })
-                cols = [5] + self._QOFsheet(sheet)
-                qof = pd.read_excel(
-                    f'{tmp}/data.xlsx', names=names.keys(), dtype=names,
-                    usecols=cols, skiprows=11, nrows=6470,
-                    sheet_name=sheet).set_index('OrganisationCode')
-                qof[f'{sheet}-prevalance'] = qof[sheet] / qof['Registered']
-                qofLS.append(qof[f'{sheet}-prevalance'])
-        qofLS = pd.concat(qofLS, axis=1)
-        return qofLS
-
-
-    def _sourceQOFmh(self):
-        url = self.sourceURL['qofMH']
-        logger.info(f'Downloading QOF 2020/2021 MH data from {url}')
-        qofMH = []
+    def _sourceQOFworkbook(self, name: str):
+        """ Retrieve one QOF workbook and summarise each of its sheets """
+        url = self.sourceURL[name]
+        logger.info(f'Downloading QOF 2020/2021 {name} data from {url}')
         with tempfile.TemporaryDirectory() as tmp:
-            urllib.request.urlretrieve(url, f'{tmp}/data.xlsx')
-            self._verifyHash('qofMH', [f'{tmp}/data.xlsx'])
-            for sheet in ['DEM', 'DEP', 'EP', 'LD', 'MH']:
-                names = ({
-                    'OrganisationCode': str,
-                    'Registered': int,
-                    sheet: int,
-                })
-                cols = [5] + self._QOFsheet(sheet)
-                qof = pd.read_excel(
-                    f'{tmp}/data.xlsx', names=names.keys(), dtype=names,
-                    usecols=cols, skiprows=11, nrows=6470,
-                    sheet_name=sheet).set_index('OrganisationCode')
-                qof[f'{sheet}-prevalance'] = qof[sheet] / qof['Registered']
-                qofMH.append(qof[f'{sheet}-prevalance'])
-        qofMH = pd.concat(qofMH, axis=1)
-        return qofMH
+            sha256 = self._download(url, f'{tmp}/data.xlsx', name=name)
+            sheets = self._readQOFworkbook(
+                name, f'{tmp}/data.xlsx', sha256, self._QOFworkbooks[name])
+        qof = pd.concat([
+            self._processQOFsheet(sheets[sheet], sheet)
+            for sheet in self._QOFworkbooks[name]], axis=1)
+        return qof, self.observedHashes.get(name)
+
+
+    def _readQOFworkbook(self, name: str, path: str, sha256: str,
+                         sheets: list):
+        """ Parse uncached sheets in a single pass of the workbook """
+        keys = {sheet: f'qof-{sha256}-{sheet}.parquet' for sheet in sheets}
+        cached = {sheet: self.store.get(key) for sheet, key in keys.items()}
+        missing = [sheet for sheet, out in cached.items() if out is None]
+        if missing:
+            logger.info(f'Parsing {", ".join(missing)} from {name}')
+            parsed = pd.read_excel(
+                path, sheet_name=missing, header=None,
+                skiprows=12, nrows=6470)
+            for sheet, data in parsed.items():
+                data.columns = data.columns.astype(str)
+                mixed = data.columns[data.dtypes == object]
+                data[mixed] = data[mixed].astype('string')
+                cached[sheet] = self._toCache(name, data, key=keys[sheet])
+        return {sheet: pd.read_parquet(out) for sheet, out in cached.items()}
+
+
+    def _processQOFsheet(self, data, sheet: str):
+        """ Compute register prevalance (and DM indicators) of one sheet """
+        names = ({
+            'OrganisationCode': str,
+            'Registered': int,
+            sheet: int,
+        })
+        cols = [5] + self._QOFsheet(sheet)
+        if sheet == 'DM':
+            extra = ({
+                'QOF-DM': float,
+                'DM019-num': int, 'DM019-den': int,
+                'DM020-num': int, 'DM020-den': int,
+            })
+            names = {**names, **extra}
+            cols += [17, 54, 59, 62, 67]
+        qof = (
+            data[[str(col) for col in sorted(cols)]]
+            .set_axis(list(names), axis=1)
+            .astype(names)
+            .set_index('OrganisationCode'))
+        qof[f'{sheet}-prevalance'] = qof[sheet] / qof['Registered']
+        if sheet == 'DM':
+            qof['DM019-BP'] = qof['DM019-num'] / qof['DM019-den']
+            qof['DM020-HbA1c'] = qof['DM020-num'] / qof['DM020-den']
+            colAppend = ([
+                'QOF-DM', 'DM019-BP', 'DM020-HbA1c',
+                f'{sheet}-prevalance'
+            ])
+            return qof[colAppend]
+        else:
+            return qof[f'{sheet}-prevalance']
 
 
     def _QOFsheet(self, name):
@@ -723,28 +1093,22 @@ class getData():
         return qof[name]
 
 
-    def _sourceMap(self):
+    def _sourceMap(self, tier: str = 'full'):
         url = self.sourceURL['geoLSOA']
         logger.info(f'Downloading LSOA Shapefile from {url}')
-        path = self._getSourcePath('geoLSOA')
         esneftLSOA = self.fromHost('esneftLSOA')
         with tempfile.TemporaryDirectory() as tmp:
-            urllib.request.urlretrieve(url, f'{tmp}/data.zip')
-            with zipfile.ZipFile(f'{tmp}/data.zip', 'r') as zipRef:
-                zipRef.extractall(f'{tmp}/')
-            self._verifyHash('geoLSOA', [f'{tmp}/infuse_lsoa_lyr_2011.shp'])
-            geodf = geopandas.read_file(f'{tmp}/infuse_lsoa_lyr_2011.shp')
-            geodf = geodf.loc[geodf['geo_code'].isin(esneftLSOA)]
-            geodf = geodf.to_crs(epsg='4326')
-
-            geodf.to_file(f'{tmp}/LSOA11-AOI-raw.geojson', driver='GeoJSON')
-            with open(f'{tmp}/LSOA11-AOI-raw.geojson', encoding='utf-8') as geofile:
-                geoLSOA11 = json.load(geofile)
-
-            for i, feature in enumerate(geoLSOA11['features']):
-                geoLSOA11['features'][i]['id'] = (
-                    geoLSOA11['features'][i]['properties']['geo_code'])
-
-            with open(path, 'w') as fh:
-                json.dump(geoLSOA11, fh)
-        return geoLSOA11
+            self._download(url, f'{tmp}/data.zip')
+            with zipfile.ZipFile(f'{tmp}/data.zip', 'r') as zipRef, \
+                    self._openMember(
+                        zipRef, 'infuse_lsoa_lyr_2011.shp', 'geoLSOA'):
+                pass
+            geodf = geopandas.read_file(
+                f'zip://{tmp}/data.zip!infuse_lsoa_lyr_2011.shp')
+        geodf = geodf.loc[geodf['geo_code'].isin(esneftLSOA)]
+        geodf = geodf.to_crs(epsg='4326')
+        out = self._toGeoCache(
+            'geoLSOA', geodf['geo_code'].tolist(),
+            pd.DataFrame(geodf.drop(columns=geodf.geometry.name)),
+            geodf.geometry.to_numpy())
+        return geometry.readGeoJSON(out, tier)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+import sys
+import json
+import logging
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+logger = logging.getLogger(__name__)
+
+
+try:
+    import shapely
+    from shapely.geometry import mapping, shape
+except ModuleNotFoundError:
+    logger.error('shapely not found - some features are unavailable.')
+
+
+# Simplification tolerance (degrees) of each precomputed tier
+TIERS = {'full': None, 'medium': 1e-4, 'coarse': 1e-3}
+
+
+def requireShapely(feature: str = 'geometry tiers'):
+    """ Raise ImportError if shapely (esneft_tools[geo]) is unavailable """
+    if 'shapely' not in sys.modules:
+        raise ImportError(
+            f'shapely is required for {feature} - install with '
+            '"pip install esneft_tools[geo]".')
+
+
+def _tierColumn(tier: str):
+    if tier not in TIERS:
+        raise ValueError(f'tier must be one of {list(TIERS)}')
+    return 'geometry' if tier == 'full' else f'geometry_{tier}'
+
+
+def fromGeoJSON(geojson: dict):
+    """ Split GeoJSON FeatureCollection into ids, properties and geometries """
+    requireShapely()
+    features = geojson['features']
+    ids = [feature.get('id') for feature in features]
+    properties = pd.DataFrame([feature['properties'] for feature in features])
+    geometries = np.array(
+        [shape(feature['geometry']) for feature in features], dtype=object)
+    return ids, properties, geometries
+
+
+def writeGeoParquet(path: str, ids, properties, geometries):
+    """ Write WKB geometries at each simplification tier as GeoParquet """
+    requireShapely()
+    # Start from ids so features without properties keep their rows
+    table = pa.table({'id': pa.array(ids, pa.string())})
+    for name, values in properties.reset_index(drop=True).items():
+        table = table.append_column(
+            str(name), pa.array(values, from_pandas=True))
+    columns = {}
+    for tier, tolerance in TIERS.items():
+        if tolerance is None:
+            tierGeometries = geometries
+        else:
+            tierGeometries = shapely.simplify(
+                geometries, tolerance, preserve_topology=True)
+        name = _tierColumn(tier)
+        table = table.append_column(
+            name, pa.array(shapely.to_wkb(tierGeometries), pa.binary()))
+        columns[name] = ({
+            'encoding': 'WKB',
+            'geometry_types': sorted(
+                {geom.geom_type for geom in tierGeometries if geom is not None}),
+        })
+    meta = ({
+        'version': '1.0.0',
+        'primary_column': 'geometry',
+        'columns': columns,
+    })
+    table = table.replace_schema_metadata(
+        {**(table.schema.metadata or {}), b'geo': json.dumps(meta).encode()})
+    pq.write_table(table, path)
+
+
+def readGeometry(path: str, tier: str = 'full', properties: bool = True):
+    """ Read ids, properties and shapely geometries at a given tier """
+    requireShapely()
+    name = _tierColumn(tier)
+    schema = pq.read_schema(path)
+    tiers = {_tierColumn(tier) for tier in TIERS}
+    columns = ([
+        col for col in schema.names
+        if (col == name) or (col not in tiers and (properties or col == 'id'))
+    ])
+    data = pq.read_table(path, columns=columns).to_pandas()
+    data[name] = shapely.from_wkb(data[name].to_numpy())
+    return data.rename({name: 'geometry'}, axis=1)
+
+
+def readGeoJSON(path: str, tier: str = 'full'):
+    """ Return GeoJSON FeatureCollection dict at a given tier """
+    data = readGeometry(path, tier)
+    geometries = data.pop('geometry')
+    ids = data.pop('id')
+    # to_dict('records') is empty when there are no property columns
+    records = data.to_dict('records') if len(data.columns) else (
+        [{}] * len(ids))
+    features = ([
+        {'type': 'Feature', 'id': id, 'properties': properties,
+         'geometry': mapping(geometry)}
+        for id, properties, geometry
+        in zip(ids, records, geometries)
+    ])
+    return {'type': 'FeatureCollection', 'features': features}
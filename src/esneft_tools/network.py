@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+
+import os
+import json
+import heapq
+import shutil
+import tempfile
+import logging
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+try:
+    import networkx as nx
+except ModuleNotFoundError:
+    logger.error('networkx not found - some features are unavailable.')
+
+try:
+    from scipy.spatial import cKDTree
+except ModuleNotFoundError:
+    logger.error('scipy not found - some features are unavailable.')
+
+
+EARTH_RADIUS_M = 6_371_009
+
+
+def _toCartesian(lat, long):
+    """ Convert lat/long (degrees) to 3D points on the unit sphere """
+    lat = np.radians(np.asarray(lat, dtype=float))
+    long = np.radians(np.asarray(long, dtype=float))
+    return np.column_stack([
+        np.cos(lat) * np.cos(long),
+        np.cos(lat) * np.sin(long),
+        np.sin(lat)])
+
+
+def hasSpatialIndex():
+    """ Return True if nearest node lookup (scipy cKDTree) is available """
+    return 'cKDTree' in globals()
+
+
+class spatialIndex():
+    """ KD-tree over node coordinates for nearest node lookup """
+
+    def __init__(self, nodes, x=None, y=None, points=None):
+        self.nodes = np.asarray(nodes)
+        self.points = _toCartesian(y, x) if points is None else points
+        self.tree = cKDTree(self.points)
+
+
+    @classmethod
+    def load(cls, path: str, nodes):
+        """ Rebuild the KD-tree from cached unit-sphere coordinates """
+        return cls(nodes, points=np.load(path))
+
+
+    def save(self, path: str):
+        """ Save unit-sphere coordinates (.npy) - the tree is rebuilt on load """
+        tmp = f'{path}.tmp-{os.getpid()}.npy'
+        np.save(tmp, self.points)
+        os.replace(tmp, path)
+
+
+    def query(self, lat, long, workers: int = 1):
+        """ Return nearest node and great-circle snap distance (metres) """
+        chord, i = self.tree.query(_toCartesian(lat, long), workers=workers)
+        distance = 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(chord / 2, 1))
+        return self.nodes[i], distance
+
+
+class roadNetwork():
+    """ Compact compressed sparse row (CSR) representation of a road graph """
+
+    arrays = ['nodes', 'x', 'y', 'indptr', 'indices', 'length']
+
+    def __init__(self, nodes, x, y, indptr, indices, length,
+                 crs: str = 'epsg:4326'):
+        self.nodes = np.asarray(nodes)
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.length = np.asarray(length, dtype=float)
+        self.crs = crs
+        self.path = None
+        self._nodeIndex = None
+        self._graph = None
+        self._spatialIndex = None
+
+
+    @classmethod
+    def fromGraph(cls, G, weight: str = 'length'):
+        """ Build CSR arrays from a (Multi)DiGraph with x/y node attributes """
+        nodes = list(G.nodes())
+        nodeIndex = {node: i for i, node in enumerate(nodes)}
+        x = np.array([G.nodes[node].get('x', np.nan) for node in nodes])
+        y = np.array([G.nodes[node].get('y', np.nan) for node in nodes])
+        edges = [(nodeIndex[u], nodeIndex[v], w)
+                 for u, v, w in G.edges(data=weight, default=1)]
+        if edges:
+            source, target, length = (np.array(e) for e in zip(*edges))
+        else:
+            source = target = np.array([], dtype=np.int64)
+            length = np.array([], dtype=float)
+        source = source.astype(np.int64)
+        order = np.argsort(source, kind='stable')
+        indptr = np.r_[0, np.cumsum(np.bincount(source, minlength=len(nodes)))]
+        network = cls(
+            np.array(nodes), x, y, indptr, target[order], length[order],
+            crs=G.graph.get('crs', 'epsg:4326'))
+        network._nodeIndex = nodeIndex
+        network._graph = G
+        return network
+
+
+    def save(self, path: str, sourceHash: str = None):
+        """ Write arrays as .npy files (memory-mappable) with metadata """
+        path = os.fspath(path)
+        parent, base = os.path.split(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        # Unique per call so concurrent writers never share a staging dir
+        tmp = tempfile.mkdtemp(prefix=f'{base}.tmp-', dir=parent)
+        os.chmod(tmp, 0o755)
+        for name in self.arrays:
+            np.save(f'{tmp}/{name}.npy', getattr(self, name))
+        meta = ({
+            'sourceHash': sourceHash,
+            'crs': self.crs,
+            'nodes': len(self.nodes),
+            'edges': len(self.indices),
+        })
+        with open(f'{tmp}/meta.json', 'w') as fh:
+            json.dump(meta, fh)
+        for attempt in range(3):
+            if self._cachedAs(path, sourceHash):
+                # Another process cached the same network first
+                shutil.rmtree(tmp, ignore_errors=True)
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            try:
+                os.replace(tmp, path)
+                break
+            except OSError:
+                # Replaced concurrently between removal and rename
+                if attempt == 2:
+                    shutil.rmtree(tmp, ignore_errors=True)
+                    raise
+        self.path = path
+        self._spatialIndex = None
+        logger.info(f'Road network cached to {path}')
+
+
+    @classmethod
+    def _cachedAs(cls, path: str, sourceHash: str):
+        """ Return True if path already caches the network of sourceHash """
+        meta = cls.readMeta(path)
+        return (
+            (sourceHash is not None) and (meta is not None)
+            and (meta.get('sourceHash') == sourceHash))
+
+
+    @staticmethod
+    def readMeta(path: str):
+        """ Return cache metadata or None if no valid cache exists """
+        try:
+            with open(f'{path}/meta.json') as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True):
+        """ Load cached arrays, memory-mapped by default """
+        meta = cls.readMeta(path)
+        mode = 'r' if mmap else None
+        arrays = ({
+            name: np.load(f'{path}/{name}.npy', mmap_mode=mode)
+            for name in cls.arrays
+        })
+        network = cls(**arrays, crs=meta['crs'])
+        network.path = path
+        return network
+
+
+    @property
+    def spatialIndex(self):
+        """ Return KD-tree of node coordinates, persisted with the cache """
+        if self._spatialIndex is None:
+            path = None if self.path is None else f'{self.path}/kdtree.npy'
+            if (path is not None) and os.path.exists(path):
+                self._spatialIndex = spatialIndex.load(path, self.nodes)
+            else:
+                self._spatialIndex = spatialIndex(self.nodes, self.x, self.y)
+                if path is not None:
+                    self._spatialIndex.save(path)
+        return self._spatialIndex
+
+
+    def nearestNodes(self, lat, long, return_dist: bool = False,
+                     workers: int = 1):
+        """ Map arrays of lat/long to nearest node (and snap distance) """
+        nodes, distance = self.spatialIndex.query(lat, long, workers)
+        return (nodes, distance) if return_dist else nodes
+
+
+    def toGraph(self):
+        """ Rebuild (and memoize) a networkx MultiDiGraph """
+        if self._graph is None:
+            G = nx.MultiDiGraph(crs=self.crs)
+            nodes = self.nodes.tolist()
+            G.add_nodes_from(
+                (node, {'x': x, 'y': y}) for node, x, y
+                in zip(nodes, self.x.tolist(), self.y.tolist()))
+            source = np.repeat(np.arange(len(nodes)), np.diff(self.indptr))
+            G.add_edges_from(
+                (nodes[u], nodes[v], {'length': w}) for u, v, w
+                in zip(source.tolist(), self.indices.tolist(),
+                       self.length.tolist()))
+            self._graph = G
+        return self._graph
+
+
+    @property
+    def nodeIndex(self):
+        """ Map node name to integer position """
+        if self._nodeIndex is None:
+            self._nodeIndex = {
+                node: i for i, node in enumerate(self.nodes.tolist())}
+        return self._nodeIndex
+
+
+    @property
+    def bounds(self):
+        """ Return (minx, miny, maxx, maxy) of all nodes """
+        return np.array([
+            np.nanmin(self.x), np.nanmin(self.y),
+            np.nanmax(self.x), np.nanmax(self.y)])
+
+
+    def __len__(self):
+        return len(self.nodes)
+
+
+    def multiSourceDistance(self, sources, cutoff: float = np.inf):
+        """ Label every node with its nearest source and distance.
+
+        A single Dijkstra traversal is seeded with every source node.
+        Nodes further than cutoff from all sources are left unlabelled
+        (distance inf, label -1). Ties are resolved in favour of the
+        earliest source in the input order.
+        """
+        indptr = self.indptr.tolist()
+        indices = self.indices.tolist()
+        length = self.length.tolist()
+        n = len(indptr) - 1
+        best = [np.inf] * n
+        bestRank = [n] * n
+        label = [-1] * n
+        distance = [np.inf] * n
+        heap = []
+        for rank, source in enumerate(sources):
+            if best[source] > 0:
+                best[source] = 0.0
+                bestRank[source] = rank
+                heap.append((0.0, rank, source))
+        heapq.heapify(heap)
+        while heap:
+            d, rank, u = heapq.heappop(heap)
+            if label[u] != -1:
+                continue
+            label[u] = rank
+            distance[u] = d
+            for i in range(indptr[u], indptr[u + 1]):
+                v = indices[i]
+                if label[v] != -1:
+                    continue
+                nd = d + length[i]
+                if nd > cutoff:
+                    continue
+                if nd < best[v] or (nd == best[v] and rank < bestRank[v]):
+                    best[v] = nd
+                    bestRank[v] = rank
+                    heapq.heappush(heap, (nd, rank, v))
+        return np.array(distance), np.array(label, dtype=np.int64)
+
+
+def asGraph(G):
+    """ Return a networkx graph from a roadNetwork or graph """
+    return G.toGraph() if isinstance(G, roadNetwork) else G
+
+
+def nearestNodes(G, lat, long, return_dist: bool = False, workers: int = 1):
+    """ Map arrays of lat/long to nearest node of a roadNetwork or graph """
+    if not isinstance(G, roadNetwork):
+        G = roadNetwork.fromGraph(G)
+    return G.nearestNodes(lat, long, return_dist=return_dist, workers=workers)
@@ -1,27 +1,40 @@
 #!/usr/bin/env python
 
-import sys
 import logging
 import numpy as np
 import pandas as pd
-from collections import defaultdict
+import pyarrow.parquet as pq
+from pandas.tseries.frequencies import to_offset
+from esneft_tools.network import roadNetwork, nearestNodes, hasSpatialIndex
 
 
 logger = logging.getLogger(__name__)
 
 
-try:
-    import osmnx as ox
-    import networkx as nx
-except ModuleNotFoundError:
-    logger.error('OSMNX not found - some features are unavailable.')
-
-
 def _weightedMean(x, cols, w='Patient'):
     """ Apply weighted mean on groupby object """
     return pd.Series(np.average(x[cols], weights=x[w], axis=0), cols)
 
 
+def _groupWeightedMean(df, group, cols, w='Patient'):
+    """ Compute weighted mean of all cols per group in one array pass """
+    codes, groups = pd.factorize(df[group], sort=True)
+    # Sort rows by integer group code (missing groups are dropped)
+    order = np.argsort(codes, kind='stable')
+    order = order[codes[order] >= 0]
+    codes = codes[order]
+    weights = df[w].to_numpy(dtype=float)[order]
+    values = df[cols].to_numpy(dtype=float)[order]
+    # Segment sums over contiguous runs of each group code
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    totals = np.add.reduceat(values * weights[:, None], starts, axis=0)
+    norm = np.add.reduceat(weights, starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = totals / norm[:, None]
+    index = pd.Index(groups, name=group)
+    return pd.DataFrame(means, index=index, columns=cols)
+
+
 def _parseIoDcols(imd: pd.DataFrame, iod_cols: list = None):
     if iod_cols is None:
         iod_cols = [col for col in imd.columns if col != 'LSOA11NM']
@@ -39,11 +52,10 @@ def getGPsummary(gpRegistration, gpPractice, gpStaff,
                  quantile: bool = True, **kwargs):
     """ Compute mean IoD per GP practice weighted by patient population """
     iod_cols = _parseIoDcols(imdLSOA, iod_cols)
-    summary = (pd
-        .merge(gpRegistration, imdLSOA[iod_cols],
-               left_on='LSOA11CD', right_index=True)
-        .groupby(['OrganisationCode'])
-        .apply(_weightedMean, iod_cols))
+    summary = _groupWeightedMean(
+        pd.merge(gpRegistration, imdLSOA[iod_cols],
+                 left_on='LSOA11CD', right_index=True),
+        'OrganisationCode', iod_cols)
     summary['Patient'] = (
         gpRegistration.groupby('OrganisationCode')['Patient'].sum())
     summary = pd.concat([summary, qof, gpPractice, gpStaff], axis=1)
@@ -60,33 +72,34 @@ def getGPsummary(gpRegistration, gpPractice, gpStaff,
             summary[col], bins, labels=list(range(bins, 0, -1)))
         summary[f'{col} ({name}{bins})'] = (
             summary[f'{col} ({name}{bins})'].astype(float).fillna(-1).astype(int))
-    if (esneftOSM is not None) and ('osmnx' in sys.modules):
+    if (esneftOSM is not None) and (not hasSpatialIndex()):
+        logger.warning('scipy not found - skipping nearest road node lookup.')
+    elif esneftOSM is not None:
         valid = summary[['Lat', 'Long']].notna().all(axis=1)
-        summary.loc[valid, 'Node'] = ox.distance.nearest_nodes(
-            esneftOSM, summary.loc[valid, 'Long'], summary.loc[valid, 'Lat'])
+        summary.loc[valid, 'Node'] = nearestNodes(
+            esneftOSM, summary.loc[valid, 'Lat'], summary.loc[valid, 'Long'])
     return summary
 
 
 def getLSOAsummary(imdLSOA, gpRegistration, populationLSOA,
                    ethnicityLSOA, areaLSOA, esneftLSOA, qof,
                    iod_cols: list = None, bins: int = 5,
-                   quantile: bool = True, **kwargs):
+                   quantile: bool = True, ageQuantiles: list = None,
+                   gpThreshold: float = 0.9, **kwargs):
     """ Return summary statistics per LSOA """
     iod_cols = _parseIoDcols(imdLSOA, iod_cols)
     maleProp = (
         populationLSOA.groupby('LSOA11CD')
         .apply(_getSexRatio).rename('MaleProp'))
-    populationLSOA = (
-        populationLSOA.groupby('LSOA11CD')
-        .apply(_summarisePopulation)
-        .rename({0: 'Age (median)', 1: 'Population'}, axis=1))
+    populationLSOA = _summarisePopulation(populationLSOA, ageQuantiles)
     # Get GP registration by LSOA
     gpRegistrationByLSOA = gpRegistration.groupby('LSOA11CD')['Patient'].sum()
     # Get number of GPs serving proportion of population
-    gpDensity = (gpRegistration
-        .groupby('LSOA11CD')['Patient']
-        .apply(_getGPthreshold, 0.9)
-        .rename('GPservices'))
+    gpDensity = _getGPthreshold(gpRegistration, gpThreshold)
+    if isinstance(gpThreshold, (list, tuple)):
+        gpDensity.columns = [f'GPservices ({t:.0%})' for t in gpThreshold]
+    else:
+        gpDensity.columns = ['GPservices']
     summary = pd.concat([
         imdLSOA['LSOA11NM'], populationLSOA, maleProp,
         ethnicityLSOA, areaLSOA, gpRegistrationByLSOA,
@@ -98,21 +111,15 @@ def getLSOAsummary(imdLSOA, gpRegistration, populationLSOA,
             summary[col], bins, labels=list(range(bins, 0, -1)))
         summary[f'{col} ({name}{bins})'] = (
             summary[f'{col} ({name}{bins})'].astype(float).fillna(-1).astype(int))
+    # Compute all QOF scores per LSOA in a single weighted aggregation
     diseases = [c for c in qof.columns if c.endswith('-prevalance')]
-    for disease in diseases:
-        logger.info(f'Processing {disease}.')
-        summary[disease] = _getLSOAweightedMean(
-            gpRegistration, qof, gp_col='OrganisationCode',
-            score_col=disease, weight_col='Patient')
-    summary['DM-QOF'] = _getLSOAweightedMean(
+    scores = {**{disease: disease for disease in diseases}, **{
+        'QOF-DM': 'DM-QOF', 'DM019-BP': 'DM-BP', 'DM020-HbA1c': 'DM-HbA1c'}}
+    logger.info(f'Processing {len(scores)} QOF scores.')
+    qofLSOA = _getLSOAweightedMean(
         gpRegistration, qof, gp_col='OrganisationCode',
-        score_col='QOF-DM', weight_col='Patient')
-    summary['DM-BP'] = _getLSOAweightedMean(
-        gpRegistration, qof, gp_col='OrganisationCode',
-        score_col='DM019-BP', weight_col='Patient')
-    summary['DM-HbA1c'] = _getLSOAweightedMean(
-        gpRegistration, qof, gp_col='OrganisationCode',
-        score_col='DM020-HbA1c', weight_col='Patient')
+        score_cols=list(scores), weight_col='Patient')
+    summary = summary.join(qofLSOA.rename(scores, axis=1))
     summary['Density'] = summary['Population'] / summary['LandHectare']
     summary['ESNEFT'] = summary.index.isin(esneftLSOA)
     # Only consider England data
@@ -128,61 +135,109 @@ def _getSexRatio(x):
     return male / total
 
 
-def _getGPthreshold(x, threshold=0.9):
-    cumprop = x.sort_values(ascending=False).cumsum() / x.sum()
-    return (cumprop < threshold).sum() + 1
-
-
-def _getLSOAweightedMean(gpRegistration, df, gp_col, score_col, weight_col):
+def _getGPthreshold(gpRegistration, thresholds=0.9):
+    """ Count GPs needed to serve each proportion of patients by LSOA """
+    if not isinstance(thresholds, (list, tuple)):
+        thresholds = [thresholds]
+    codes, lsoas = pd.factorize(gpRegistration['LSOA11CD'], sort=True)
+    patients = gpRegistration['Patient'].to_numpy()
+    # Sort practices by descending registrations within each LSOA
+    order = np.lexsort((-patients, codes))
+    order = order[codes[order] >= 0]
+    codes, patients = codes[order], patients[order]
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    cumulative = np.cumsum(patients)
+    offset = cumulative[starts] - patients[starts]
+    total = np.add.reduceat(patients, starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cumprop = (cumulative - offset[codes]) / total[codes]
+    gpDensity = pd.DataFrame(index=pd.Index(lsoas, name='LSOA11CD'))
+    for threshold in thresholds:
+        below = np.bincount(
+            codes, weights=(cumprop < threshold), minlength=len(lsoas))
+        gpDensity[threshold] = below.astype(int) + 1
+    return gpDensity
+
+
+def _getLSOAweightedMean(gpRegistration, df, gp_col, score_cols, weight_col):
     """ Compute LSOA prevalence by weighted mean across GP """
+    if isinstance(score_cols, str):
+        score_cols = [score_cols]
     gpTmp = pd.merge(
-        gpRegistration, df,
+        gpRegistration[['LSOA11CD', gp_col, weight_col]], df[score_cols],
         left_on=gp_col, right_index=True)
     gpTmp = gpTmp.loc[gpTmp[weight_col] > 0]
-    prevalance = (
-        gpTmp.groupby('LSOA11CD')
-        .apply(lambda x: np.average(x[score_col], weights=x[weight_col])))
+    prevalance = _groupWeightedMean(
+        gpTmp, 'LSOA11CD', score_cols, w=weight_col)
     return prevalance
 
 
-def _summarisePopulation(x):
-    """ Get median Age and total populaiton by LSOA"""
-    allAges = []
-    for row in x.itertuples():
-        allAges.extend([row.Age] * row.Population)
-    return pd.Series([np.median(allAges), x['Population'].sum()])
+def _summarisePopulation(populationLSOA, quantiles: list = None):
+    """ Get median Age (and other quantiles) and total population by LSOA """
+    quantiles = [] if quantiles is None else list(quantiles)
+    codes, lsoas = pd.factorize(populationLSOA['LSOA11CD'], sort=True)
+    ages = pd.to_numeric(populationLSOA['Age']).to_numpy(dtype=float)
+    counts = populationLSOA['Population'].to_numpy(dtype=np.int64)
+    # Sort by LSOA then Age to form a cumulative age histogram per LSOA
+    order = np.lexsort((ages, codes))
+    order = order[codes[order] >= 0]
+    codes, ages, counts = codes[order], ages[order], counts[order]
+    cumulative = np.cumsum(counts)
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    total = np.add.reduceat(counts, starts)
+    # Number of residents in all preceding LSOAs
+    offset = cumulative[starts] - counts[starts]
+    summary = pd.DataFrame(index=pd.Index(lsoas, name='LSOA11CD'))
+    for q in [0.5] + quantiles:
+        # Linear interpolation between ranks, as in np.quantile
+        position = q * (total - 1)
+        lower = np.floor(position)
+        upper = np.ceil(position)
+        lowerAge, upperAge = [
+            ages[np.minimum(
+                np.searchsorted(cumulative, offset + rank, side='right'),
+                len(ages) - 1)]
+            for rank in (lower, upper)]
+        age = lowerAge + (position - lower) * (upperAge - lowerAge)
+        name = 'Age (median)' if q == 0.5 else f'Age ({q:.0%})'
+        summary[name] = np.where(total > 0, age, np.nan)
+        if q == 0.5:
+            summary['Population'] = total
+    return summary
 
 
 def _checkInBounds(x, bounds):
     return (
-            bounds[0] <= x['Long'] <= bounds[2]
-        and bounds[1] <= x['Lat'] <= bounds[3]
+            x['Long'].between(bounds[0], bounds[2])
+        & x['Lat'].between(bounds[1], bounds[3])
     )
 
 
 def computeTravelDistance(G, locations, dist=20000):
-    fullBounds = ox.graph_to_gdfs(G, edges=False).total_bounds
-    inBounds = locations.apply(_checkInBounds, args=(fullBounds,), axis=1)
+    """ Compute road distance from every node to its nearest location """
+    if not isinstance(G, roadNetwork):
+        G = roadNetwork.fromGraph(G)
+    inBounds = _checkInBounds(locations, G.bounds)
     locations = locations.loc[inBounds].copy()
-    distances = defaultdict(lambda: (np.inf, None))
     # Retrieve dictionary of ref nodes mapping to site ID
     nodeSites = (locations.groupby('Node').apply(
         lambda x: tuple(x.index)).to_dict())
-    checked = set()
-    for i, refNode in enumerate(locations['Node'].unique()):
-        subgraph = nx.ego_graph(G, refNode, radius=dist, distance='length')
-        allShortest = nx.shortest_path_length(
-            subgraph, refNode, weight='length', method='dijkstra')
-        for node, distance in allShortest.items():
-            if distance < distances[node][0]:
-                distances[node] = (distance, nodeSites[refNode])
-        checked.update(set(subgraph.nodes()))
-    completion = len(checked) / len(G.nodes())
-    unchecked = set(G.nodes()) - checked
+    refNodes = [node for node in locations['Node'].unique()
+                if node in G.nodeIndex]
+    if len(refNodes) < locations['Node'].nunique():
+        logger.warning('Some location nodes are missing from the graph.')
+    # Label every node with nearest site in one multi-source traversal
+    distance, label = G.multiSourceDistance(
+        [G.nodeIndex[node] for node in refNodes], cutoff=dist)
+    checked = label >= 0
+    completion = checked.sum() / len(G)
+    unchecked = set(G.nodes[~checked].tolist())
     logger.info(
         f'{completion:.1%} complete, {len(unchecked)} nodes > {dist} away.')
-    distances = pd.DataFrame.from_dict(
-        distances, orient='index', columns=['Distance', 'SiteIDs'])
+    distances = pd.DataFrame({
+        'Distance': distance[checked],
+        'SiteIDs': [nodeSites[refNodes[i]] for i in label[checked]],
+    }, index=G.nodes[checked])
     return distances, unchecked
 
 
@@ -212,24 +267,141 @@ def prepTime(df, start, end=None, interval='1W', group=None, index=None):
     return df[cols].reset_index(drop=drop)
 
 
-def summariseTime(df: pd.DataFrame, interval='1W', normByGroup: bool = False):
-    """ Compute normalised event frequency within constant time interval """
-    mergeFunc = lambda x: pd.date_range(x['start'], x['end'], freq=interval)
-    df = pd.merge(
-        df, df.apply(mergeFunc, axis=1).explode().rename('period'),
-        left_index=True, right_index=True)
-
-    df['period'] = df['period'].dt.to_period(interval)
-    groups = ['group', 'period']
-    df = df.groupby(groups).size().reset_index()
-
+def _countPoints(start, end, offset):
+    """ Return first date_range(start, end) point and number of points """
+    if isinstance(offset, (pd.offsets.Tick, pd.offsets.Day)):
+        if isinstance(offset, pd.offsets.Day):
+            step = pd.Timedelta(days=offset.n)
+        else:
+            step = pd.Timedelta(offset)
+        first = start
+        npoints = ((end - start) // step) + 1
+    else:
+        # Anchored offsets are resolved once per unique (start, end)
+        pairs = pd.MultiIndex.from_arrays([start, end])
+        unique = pairs.unique()
+        ranges = [pd.date_range(s, e, freq=offset) for s, e in unique]
+        first = pd.Series(pd.to_datetime(
+            [r[0] if len(r) else pd.NaT for r in ranges]), index=unique)
+        npoints = pd.Series([len(r) for r in ranges], index=unique)
+        first = pd.Series(first.reindex(pairs).to_numpy(), index=start.index)
+        npoints = pd.Series(npoints.reindex(pairs).to_numpy(), index=start.index)
+    return first, npoints
+
+
+def _countTime(df: pd.DataFrame, interval='1W'):
+    """ Count events per group and period by interval sweep """
+    offset = to_offset(interval)
+    start = pd.to_datetime(df['start'])
+    end = pd.to_datetime(df['end'])
+    first, npoints = _countPoints(start, end, offset)
+    valid = (npoints > 0).to_numpy()
+    first = first.loc[valid]
+    npoints = npoints.to_numpy()[valid].astype(np.int64)
+    # Consecutive points fall in periods spaced by a constant stride
+    firstOrd = first.dt.to_period(interval).array.asi8
+    stride = (first + offset).dt.to_period(interval).array.asi8 - firstOrd
+    phase = firstOrd % stride
+    # Each lane is a (group, stride, phase) with its own period grid
+    groupCode, groups = pd.factorize(df['group'].to_numpy()[valid], sort=True)
+    strideCode, strides = pd.factorize(stride, sort=True)
+    phaseCode, phases = pd.factorize(phase, sort=True)
+    laneKey = ((groupCode * len(strides) + strideCode) * len(phases)
+               + phaseCode)
+    keep = groupCode >= 0
+    lane, laneKey = pd.factorize(laneKey[keep], sort=True)
+    laneGroup = groups[laneKey // (len(strides) * len(phases))]
+    laneStride = strides[(laneKey // len(phases)) % len(strides)]
+    lanePhase = phases[laneKey % len(phases)]
+    npoints = npoints[keep]
+    position = (firstOrd // stride)[keep]
+    # Difference array: +1 at first period and -1 after the last period
+    eventLane = np.r_[lane, lane]
+    eventPos = np.r_[position, position + npoints]
+    delta = np.r_[np.ones(len(lane), dtype=np.int64),
+                  -np.ones(len(lane), dtype=np.int64)]
+    minPos = eventPos.min() if len(eventPos) else 0
+    span = (eventPos.max() - minPos + 1) if len(eventPos) else 1
+    order = np.argsort(eventLane * span + (eventPos - minPos))
+    eventLane, eventPos, delta = (
+        eventLane[order], eventPos[order], delta[order])
+    boundary = np.ones(len(delta), dtype=bool)
+    boundary[1:] = ((eventLane[1:] != eventLane[:-1])
+                    | (eventPos[1:] != eventPos[:-1]))
+    delta = np.add.reduceat(delta, np.flatnonzero(boundary))
+    eventLane, eventPos = eventLane[boundary], eventPos[boundary]
+    # Each lane sums to zero so a global cumsum is the running count
+    count = np.cumsum(delta)
+    # Count holds from each event position until the next in the lane
+    runLength = np.zeros(len(count), dtype=np.int64)
+    runLength[:-1] = np.where(
+        eventLane[1:] == eventLane[:-1], np.diff(eventPos), 0)
+    runLength[count <= 0] = 0
+    runs = np.repeat(np.arange(len(count)), runLength)
+    runStart = np.cumsum(runLength) - runLength
+    offsetInRun = np.arange(len(runs)) - runStart[runs]
+    runLane = eventLane[runs]
+    ordinal = (
+        (eventPos[runs] + offsetInRun) * laneStride[runLane]
+        + lanePhase[runLane])
+    counts = pd.DataFrame({
+        'group': laneGroup[runLane],
+        'period': pd.arrays.PeriodArray(
+            ordinal.astype(np.int64), dtype=pd.PeriodDtype(interval)),
+        'count': count[runs],
+    })
+    return (counts.sort_values(['group', 'period'], kind='stable')
+            .reset_index(drop=True))
+
+
+def _normaliseTime(df: pd.DataFrame, normByGroup: bool = False):
+    """ Convert period counts to normalised frequency timeline """
+    df = df.copy()
     df['start'] = df['period'].dt.start_time
     df['end'] = df['period'].dt.end_time + pd.Timedelta(1)
 
     if normByGroup:
-        df['Freq.'] = df.groupby('group')[0].transform(lambda x: x / x.max())
-        order = None
+        df['Freq.'] = df['count'] / df.groupby('group')['count'].transform('max')
+    else:
+        df['Freq.'] = df['count'] / df['count'].max()
+    return df.drop(['period', 'count'], axis=1)
+
+
+def summariseTime(df: pd.DataFrame, interval='1W', normByGroup: bool = False):
+    """ Compute normalised event frequency within constant time interval """
+    return _normaliseTime(_countTime(df, interval), normByGroup)
+
+
+def _readChunks(path: str, columns: list, chunksize: int):
+    """ Yield DataFrame chunks of selected columns from parquet or CSV """
+    if str(path).endswith('.parquet'):
+        parquet = pq.ParquetFile(path)
+        for batch in parquet.iter_batches(
+                batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
     else:
-        df['Freq.'] = df[0] / df[0].max()
-        order = df.groupby('group')['Freq.'].sum().sort_values().index
-    return df.drop(['period', 0], axis=1)
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
+
+
+def streamTime(path: str, start, end=None, interval='1W', group=None,
+               normByGroup: bool = False, chunksize: int = 1_000_000):
+    """ Compute summariseTime output by streaming events from file """
+    columns = [c for c in [start, end, group] if c is not None]
+    counts = None
+    for i, chunk in enumerate(_readChunks(path, columns, chunksize)):
+        logger.info(f'Processing chunk {i} ({len(chunk)} events).')
+        chunk = prepTime(
+            chunk, start=start, end=end, interval=interval, group=group)
+        chunkCounts = _countTime(chunk, interval)
+        if counts is not None:
+            chunkCounts = pd.concat([counts, chunkCounts])
+        # Accumulated counts are bounded by groups x periods
+        counts = (chunkCounts
+            .groupby(['group', 'period'], sort=False)['count'].sum()
+            .reset_index())
+    if counts is None:
+        counts = _countTime(
+            pd.DataFrame(columns=['group', 'start', 'end']), interval)
+    counts = (counts.sort_values(['group', 'period'], kind='stable')
+              .reset_index(drop=True))
+    return _normaliseTime(counts, normByGroup)
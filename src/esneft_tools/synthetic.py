@@ -1,79 +1,110 @@
 #!/usr/bin/env python
 
-import random
 import logging
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from esneft_tools import download
-from datetime import timedelta, datetime
+from datetime import datetime
 
 
 logger = logging.getLogger(__name__)
 
 
-def _randomDate(start, delta='1Y'):
-    """ Generate random date in range """
-    if pd.isnull(start):
-        return start
+def _randomDate(rng, start, delta='365d'):
+    """ Generate random dates in range [start, start + delta) """
     delta = pd.Timedelta(delta)
     int_delta = (delta.days * 24 * 60 * 60) + delta.seconds
-    random_second = random.randrange(int_delta)
-    return start + timedelta(seconds=random_second)
+    seconds = rng.integers(int_delta, size=len(start))
+    return start + pd.to_timedelta(seconds, unit='s')
 
 
-def emergency(size: int = 10_000, seed: int = 42):
-    np.random.seed(seed)
-    random.seed(seed)
+def _dropRandom(rng, x, p):
+    """ Set a random proportion (p) of values to missing """
+    return x.mask(rng.random(len(x)) < p)
+
+
+def _getPostcodes():
+    """ Retrieve postcodes within ESNEFT """
     getData = download.getData()
     postcodes = getData.fromHost('postcodeLSOA')
     esneftLSOA = getData.fromHost('esneftLSOA')
-    postcodes = postcodes[postcodes.isin(esneftLSOA)].index
-    # Define fewer patients then entries
-    nPatients = int(size*0.61) if size > 1 else 1
-    inc1 = datetime.strptime('1/1/2018', '%d/%m/%Y')
+    return postcodes[postcodes.isin(esneftLSOA)].index
+
 
+def _emergency(rng, size, nPatients, postcodes, start=0):
+    """ Generate one partition of synthetic emergency attendances """
+    inc1 = datetime.strptime('1/1/2018', '%d/%m/%Y')
     data = pd.DataFrame({
-        'site': np.random.choice(
+        'site': rng.choice(
             ['Ipswich', 'Colchester'], size=size, p=[0.52, 0.48]),
-        'AEDid': range(size),
-        'patientID': np.random.choice(range(nPatients), size=size),
-        'Age': np.random.randint(0, 100, size=size),
-        'Sex': np.random.choice(
+        'AEDid': np.arange(start, start + size),
+        'patientID': rng.integers(nPatients, size=size),
+        'Age': rng.integers(0, 100, size=size),
+        'Sex': rng.choice(
             ['Female', 'Male', 'Unknown'],
             p=[0.51, 0.48, 0.01], size=size),
-        'Ethnicity': np.random.choice(
+        'Ethnicity': rng.choice(
             ['White', 'Unknown', 'Other', 'Mixed', 'Asian', 'Black'],
             p=[0.79, 0.15, 0.02, 0.02, 0.01, 0.01], size=size),
-        'Postcode': np.random.choice(postcodes, size=size),
-        'presentingSymptoms': np.random.choice(
+        'Postcode': rng.choice(postcodes, size=size),
+        'presentingSymptoms': rng.choice(
             ['Chest pain', 'General Weakness', 'Abdominal pain', 'Falls'],
             p=[0.31, 0.29, 0.24, 0.16], size=size),
-        'disposalMethod': np.random.choice(
+        'disposalMethod': rng.choice(
             ['Discharged', 'Admitted', 'Discharged - follow up', 'Other'],
             p=[0.36, 0.33, 0.21, 0.1], size=size),
-        'incidentDateTime': [_randomDate(inc1, '365d') for i in range(size)],
+        'incidentDateTime': _randomDate(
+            rng, pd.Series(pd.Timestamp(inc1), index=range(size)), '365d'),
     })
 
-    data['arrivalDateTime'] = data['incidentDateTime'].apply(_randomDate, args=('4d',))
-    data['registeredDateTime'] = data['arrivalDateTime'].apply(_randomDate, args=('4m',))
-    data['triagedDateTime'] = data['registeredDateTime'].apply(_randomDate, args=('32m',))
-    data['seen1DateTime'] = data['triagedDateTime'].apply(_randomDate, args=('2h',))
-    data['seen2DateTime'] = data['seen1DateTime'].apply(_randomDate, args=('2h',))
-    data['fitDischargeDateTime'] = data['seen2DateTime'].apply(_randomDate, args=('90m',))
-    data['departDateTime'] = data['fitDischargeDateTime'].apply(_randomDate, args=('10m',))
-
-    data['incidentDateTime'] = data['incidentDateTime'].apply(
-        lambda x :np.datetime64('NaT') if np.random.random() < 0.58 else x)
-    data['registeredDateTime'] = data['registeredDateTime'].apply(
-        lambda x :np.datetime64('NaT') if np.random.random() < 0.51 else x)
-    data['triagedDateTime'] = data['triagedDateTime'].apply(
-        lambda x :np.datetime64('NaT') if np.random.random() < 0.1 else x)
-    data['seen1DateTime'] = data['seen1DateTime'].apply(
-        lambda x :np.datetime64('NaT') if np.random.random() < 0.05 else x)
-    data['seen2DateTime'] = data.apply(
-        lambda x : (np.datetime64('NaT') if (np.random.random() < 0.92
-                    or pd.isnull(x['seen1DateTime'])) else x['seen2DateTime']),
-                    axis = 1)
-    data['fitDischargeDateTime'] = data['fitDischargeDateTime'].apply(
-        lambda x :np.datetime64('NaT') if np.random.random() < 0.37 else x)
+    data['arrivalDateTime'] = _randomDate(rng, data['incidentDateTime'], '4d')
+    data['registeredDateTime'] = _randomDate(rng, data['arrivalDateTime'], '4m')
+    data['triagedDateTime'] = _randomDate(rng, data['registeredDateTime'], '32m')
+    data['seen1DateTime'] = _randomDate(rng, data['triagedDateTime'], '2h')
+    data['seen2DateTime'] = _randomDate(rng, data['seen1DateTime'], '2h')
+    data['fitDischargeDateTime'] = _randomDate(rng, data['seen2DateTime'], '90m')
+    data['departDateTime'] = _randomDate(rng, data['fitDischargeDateTime'], '10m')
+
+    data['incidentDateTime'] = _dropRandom(rng, data['incidentDateTime'], 0.58)
+    data['registeredDateTime'] = _dropRandom(rng, data['registeredDateTime'], 0.51)
+    data['triagedDateTime'] = _dropRandom(rng, data['triagedDateTime'], 0.1)
+    data['seen1DateTime'] = _dropRandom(rng, data['seen1DateTime'], 0.05)
+    data['seen2DateTime'] = _dropRandom(rng, data['seen2DateTime'], 0.92).mask(
+        data['seen1DateTime'].isna())
+    data['fitDischargeDateTime'] = _dropRandom(rng, data['fitDischargeDateTime'], 0.37)
     return data
+
+
+def emergency(size: int = 10_000, seed: int = 42, postcodes=None):
+    rng = np.random.default_rng(seed)
+    if postcodes is None:
+        postcodes = _getPostcodes()
+    # Define fewer patients then entries
+    nPatients = int(size*0.61) if size > 1 else 1
+    return _emergency(rng, size, nPatients, postcodes)
+
+
+def emergencyToParquet(path: str, size: int = 10_000_000, seed: int = 42,
+                       chunksize: int = 1_000_000, postcodes=None):
+    """ Stream synthetic emergency data to parquet in partitions """
+    rng = np.random.default_rng(seed)
+    if postcodes is None:
+        postcodes = _getPostcodes()
+    nPatients = int(size*0.61) if size > 1 else 1
+    writer = None
+    try:
+        for start in range(0, size, chunksize):
+            n = min(chunksize, size - start)
+            logger.info(f'Writing rows {start} - {start + n} to {path}')
+            table = pa.Table.from_pandas(
+                _emergency(rng, n, nPatients, postcodes, start=start),
+                preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    return path
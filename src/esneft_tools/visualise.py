@@ -1,12 +1,18 @@
 #!/usr/bin/env python
 
+import os
 import sys
+import time
 import logging
 import matplotlib
+import matplotlib.pyplot as plt
+import matplotlib.collections
 import numpy as np
 import pandas as pd
 import plotly.express as px
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from esneft_tools.network import asGraph, roadNetwork
 
 
 logger = logging.getLogger(__name__)
@@ -18,10 +24,48 @@ except ModuleNotFoundError:
     logger.error('OSMNX not found - some features are unavailable.')
 
 
+# Plotly >= 5.24 renders tile maps with MapLibre (*_map); *_mapbox is removed in 7
+MAPLIBRE = hasattr(px, 'choropleth_map')
+
+
+def _tileMap(name, style, **kwargs):
+    """ Call a plotly express tile map function with the available backend """
+    if MAPLIBRE:
+        return getattr(px, f'{name}_map')(map_style=style, **kwargs)
+    return getattr(px, f'{name}_mapbox')(mapbox_style=style, **kwargs)
+
+
+def _quantise(coordinates, precision):
+    """ Round nested coordinate lists to a number of decimal places """
+    if not len(coordinates) or isinstance(coordinates[0], (int, float)):
+        return np.round(np.asarray(coordinates, dtype=float), precision).tolist()
+    elif isinstance(coordinates[0][0], (int, float)):
+        # Round a whole ring (list of positions) at once
+        return np.round(np.asarray(coordinates, dtype=float), precision).tolist()
+    return [_quantise(values, precision) for values in coordinates]
+
+
+def quantiseGeoJSON(geojson, precision=5):
+    """ Return copy of GeoJSON with coordinates rounded to precision (dp) """
+    features = []
+    for feature in geojson['features']:
+        geometry = feature['geometry']
+        features.append({
+            **feature,
+            'geometry': {
+                **geometry,
+                'coordinates': _quantise(geometry['coordinates'], precision)
+            }
+        })
+    return {**geojson, 'features': features}
+
+
 def choroplethLSOA(
         LSOAsummary, geojson, colour, location=None,
-        hover=None, cmap='viridis'):
-    assert colour in LSOAsummary.columns
+        hover=None, cmap='viridis', precision=None):
+    """ Choropleth of LSOA data; multiple colour columns share geometry """
+    layers = [colour] if isinstance(colour, str) else list(colour)
+    assert all(layer in LSOAsummary.columns for layer in layers)
     if (hover is None) and ('LSOA11NM' in LSOAsummary.columns):
         hover = ['LSOA11NM']
     if location is None:
@@ -29,39 +73,84 @@ def choroplethLSOA(
         LSOAsummary = LSOAsummary.reset_index()
     else:
         assert location in LSOAsummary.columns
-    fig = px.choropleth_mapbox(
-        LSOAsummary, geojson=geojson,
-        locations=location, color=colour,
+    if precision is not None:
+        geojson = quantiseGeoJSON(geojson, precision)
+    fig = _tileMap(
+        'choropleth', "carto-positron",
+        data_frame=LSOAsummary, geojson=geojson,
+        locations=location, color=layers[0],
         hover_data=hover,
         color_continuous_scale=cmap,
-        mapbox_style="carto-positron",
         zoom=8.5, center = {'lat': 52.08, 'lon': 1.02},
         width=870, height=700, opacity=0.5
     )
+    if len(layers) > 1:
+        _addLayerMenu(fig, LSOAsummary, layers)
     return fig
 
 
-def scatterGP(GPsummary, minCount=1, palette=px.colors.qualitative.Plotly):
+def _addLayerMenu(fig, LSOAsummary, layers):
+    """ Add dropdown restyling z of the single trace for each column """
+    template = fig.data[0].hovertemplate
+    buttons = []
+    for layer in layers:
+        values = LSOAsummary[layer]
+        buttons.append({
+            'label': layer,
+            'method': 'update',
+            'args': [
+                {'z': [values.to_numpy()],
+                 'hovertemplate': template.replace(
+                     f'{layers[0]}=', f'{layer}=')},
+                {'coloraxis.colorbar.title.text': layer,
+                 'coloraxis.cmin': float(values.min()),
+                 'coloraxis.cmax': float(values.max())}
+            ]
+        })
+    fig.update_layout(
+        updatemenus=[{
+            'buttons': buttons, 'direction': 'down',
+            'x': 0.01, 'xanchor': 'left', 'y': 0.99, 'yanchor': 'top'}],
+        coloraxis={
+            'cmin': float(LSOAsummary[layers[0]].min()),
+            'cmax': float(LSOAsummary[layers[0]].max())})
+
+
+def _formatGP(GPsummary, minCount=1):
+    """ Prepare GP summary for display (vectorised) """
     GPsummary = GPsummary.copy()
     # Aggregate settings with too few counts
     count = GPsummary['PrescribingSetting'].value_counts()
-    tooFew = count[count < minCount].index
-    GPsummary['PrescribingSetting'] = GPsummary['PrescribingSetting'].apply(
-        lambda x: 'Other' if x in tooFew else x
-    )
-    GPsummary['IMD'] = GPsummary['IMD'].apply(lambda x: f'{x:.3f}')
+    tooFew = count.index[count < minCount]
+    GPsummary['PrescribingSetting'] = GPsummary['PrescribingSetting'].mask(
+        GPsummary['PrescribingSetting'].isin(tooFew), 'Other')
     GPsummary['OpenDate'] = GPsummary['OpenDate'].astype(str)
     GPsummary['Patient'] = GPsummary['Patient'].fillna(-1).astype(int)
-    fig = px.scatter_mapbox(
-        GPsummary, lat='Lat', lon='Long',
+    return GPsummary
+
+
+def scatterGP(GPsummary, minCount=1, palette=px.colors.qualitative.Plotly,
+              maxPoints=5_000, nHexagon=40, binColour=None, maxNames=5):
+    """ Map GP practices; above maxPoints aggregate into hexagonal bins.
+
+    Binned maps draw one polygon per occupied hexagon (no practice markers),
+    coloured by practice count or by the mean of binColour (e.g. 'IMD').
+    Set maxPoints=None to always plot individual practices.
+    """
+    GPsummary = _formatGP(GPsummary, minCount)
+    if (maxPoints is not None) and (len(GPsummary) > maxPoints):
+        return _hexbinGP(GPsummary, nHexagon, binColour, maxNames)
+    fig = _tileMap(
+        'scatter', "carto-positron",
+        data_frame=GPsummary, lat='Lat', lon='Long',
         hover_name='OrganisationName',
-        hover_data=['PCDS', 'Status', 'IMD', 'Patient', 'OpenDate'],
+        hover_data={
+            'PCDS': True, 'Status': True, 'IMD': ':.3f',
+            'Patient': True, 'OpenDate': True},
         color='PrescribingSetting',
         color_discrete_sequence=palette,
-        mapbox_style="carto-positron",
         zoom=8.2, center = {'lat': 52.08, 'lon': 1.02},
         width=870, height=600, opacity=1
-
     )
     fig.update_layout(legend=dict(
         orientation='h', yanchor='bottom', y=1.02,
@@ -69,38 +158,203 @@ def scatterGP(GPsummary, minCount=1, palette=px.colors.qualitative.Plotly):
     return fig
 
 
+def _toMercator(lat, long):
+    y = np.log(np.tan((np.pi / 4) + (np.radians(lat) / 2)))
+    return np.radians(long), y
+
+
+def _fromMercator(x, y):
+    return np.degrees((2 * np.arctan(np.exp(y))) - (np.pi / 2)), np.degrees(x)
+
+
+def _hexbin(lat, long, nHexagon=40):
+    """ Assign points to a regular hexagonal grid (as matplotlib hexbin).
+
+    Returns integer bin labels per point and the (lat, long) vertices of
+    each labelled hexagon (shape: bins x 7, closed rings).
+    """
+    x, y = _toMercator(np.asarray(lat), np.asarray(long))
+    sx = max(x.max() - x.min(), 1e-9) / nHexagon
+    sy = sx * np.sqrt(3)
+    ix, iy = (x - x.min()) / sx, (y - y.min()) / sy
+    # Nearest centre of two offset rectangular lattices
+    i1, j1 = np.round(ix), np.round(iy)
+    i2, j2 = np.floor(ix), np.floor(iy)
+    d1 = (ix - i1) ** 2 + 3 * (iy - j1) ** 2
+    d2 = (ix - i2 - 0.5) ** 2 + 3 * (iy - j2 - 0.5) ** 2
+    first = d1 <= d2
+    cx = np.where(first, i1, i2 + 0.5)
+    cy = np.where(first, j1, j2 + 0.5)
+    centres, labels = np.unique(
+        np.column_stack([cx, cy]), axis=0, return_inverse=True)
+    ring = np.array([
+        [.5, -.5], [.5, .5], [0., 1.], [-.5, .5], [-.5, -.5], [0., -1.],
+        [.5, -.5]]) * [1, 1 / 3]
+    vx = x.min() + (centres[:, [0]] + ring[:, 0]) * sx
+    vy = y.min() + (centres[:, [1]] + ring[:, 1]) * sy
+    return labels.ravel(), _fromMercator(vx, vy)
+
+
+def _hexbinGP(GPsummary, nHexagon=40, binColour=None, maxNames=5):
+    """ Aggregate GP practices into hexagonal bins """
+    required = ['Lat', 'Long'] + ([] if binColour is None else [binColour])
+    GPsummary = GPsummary.dropna(subset=required)
+    # Exclude placeholder coordinates (e.g. NSPL 99.999999 for no grid ref)
+    GPsummary = GPsummary.loc[GPsummary['Lat'].between(-85, 85)]
+    labels, (lats, longs) = _hexbin(
+        GPsummary['Lat'], GPsummary['Long'], nHexagon)
+    grouped = GPsummary.groupby(labels)
+    bins = pd.DataFrame({'Practices': grouped.size()})
+    colour = 'Practices'
+    if binColour is not None:
+        colour = f'{binColour} (mean)'
+        bins[colour] = grouped[binColour].mean()
+    names = grouped['OrganisationName'].agg(
+        lambda x: '<br>'.join(x.iloc[:maxNames].astype(str)))
+    more = (bins['Practices'] - maxNames).clip(lower=0)
+    bins['Names'] = names.where(
+        more == 0, names + '<br>... and ' + more.astype(str) + ' more')
+    geojson = {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'id': int(i), 'properties': {},
+         'geometry': {'type': 'Polygon', 'coordinates': [
+             np.column_stack([longs[i], lats[i]]).round(5).tolist()]}}
+        for i in bins.index]}
+    fig = _tileMap(
+        'choropleth', "carto-positron",
+        data_frame=bins.reset_index(names='bin'), geojson=geojson,
+        locations='bin', color=colour,
+        hover_data={'bin': False, 'Practices': True, 'Names': True,
+                    **({} if binColour is None else {colour: ':.3f'})},
+        color_continuous_scale='viridis',
+        zoom=5.5, center={'lat': 52.8, 'lon': -1.5},
+        width=870, height=600, opacity=0.6
+    )
+    return fig
+
+
+def _getNodes(G):
+    """ Return node names of a roadNetwork or networkx graph """
+    return G.nodes if isinstance(G, roadNetwork) else list(G.nodes())
+
+
+def _getNorm(distances, vmin=0, vmax=0.9, quantile=True):
+    if quantile:
+        vmax = np.quantile(distances['Distance'], vmax)
+    return matplotlib.colors.Normalize(vmin=vmin, vmax=vmax)
+
+
 def _setNodeProperties(
         G, distances, vmin=0, vmax=0.9, quantile=True,
         cmap='viridis_r', size=10):
-    if quantile:
-        vmax = np.quantile(distances['Distance'], vmax)
-    norm = matplotlib.colors.Normalize(vmin=vmin, vmax=vmax)
-    cmap = matplotlib.cm.get_cmap(cmap)
-    colours = []
-    sizes = []
-    for node in G.nodes():
-        if node not in distances.index:
-            colour = (1,1,1,1)
-            size = 0
-        else:
-            colour = cmap(norm(distances.loc[node, 'Distance']))
-            size = 10
-        colours.append(colour)
-        sizes.append(size)
+    norm = _getNorm(distances, vmin, vmax, quantile)
+    cmap = matplotlib.colormaps.get_cmap(cmap)
+    # Position of each node in distances (-1 if unreached)
+    index = distances.index.get_indexer(_getNodes(G))
+    reached = index >= 0
+    colours = np.ones((len(index), 4))
+    colours[reached] = cmap(
+        norm(distances['Distance'].to_numpy(dtype=float)[index[reached]]))
+    sizes = np.where(reached, size, 0)
     return colours, sizes
 
 
 def plotTravelTime(
         G, distances, quantile=True, maxQuant=0.95,
         cmap='viridis_r', size=10, dpi=300, alpha=0.8,
-        figsize=(15,15),out=None):
+        figsize=(15,15), out=None, minEdgeLength=None, raster=None,
+        bgcolor='#111111', edgeColour='#999999'):
+    """ Plot road network coloured by travel distance.
+
+    For large graphs set minEdgeLength (metres) to draw only longer edges
+    from the CSR arrays, or raster (pixels along the longest side) to
+    rasterise the minimum node distance per pixel.
+    """
+    if raster is not None:
+        return _rasterTravelTime(
+            G, distances, quantile=quantile, maxQuant=maxQuant, cmap=cmap,
+            raster=raster, dpi=dpi, figsize=figsize, out=out,
+            bgcolor=bgcolor)
     colours, sizes = _setNodeProperties(
         G, distances, vmin=0, vmax=maxQuant,
         quantile=quantile, cmap=cmap, size=size)
+    if minEdgeLength is not None:
+        return _plotNetwork(
+            G, colours, sizes, minEdgeLength=minEdgeLength, alpha=alpha,
+            dpi=dpi, figsize=figsize, out=out, bgcolor=bgcolor,
+            edgeColour=edgeColour)
+    G = asGraph(G)
     fig, ax = ox.plot_graph(
-        G, node_color=colours, node_size=sizes,
+        G, node_color=colours, node_size=sizes.tolist(),
         node_alpha=alpha, figsize=figsize,
-        save=(out is not None), dpi=dpi, filepath=out)
+        save=(out is not None), dpi=dpi, filepath=out,
+        bgcolor=bgcolor, edge_color=edgeColour)
+    return fig, ax
+
+
+def _newAxes(network, figsize, bgcolor):
+    fig, ax = plt.subplots(figsize=figsize, facecolor=bgcolor)
+    ax.set_facecolor(bgcolor)
+    minx, miny, maxx, maxy = network.bounds
+    ax.set_xlim(minx, maxx)
+    ax.set_ylim(miny, maxy)
+    # Approximate equal-distance aspect at this latitude
+    ax.set_aspect(1 / np.cos(np.radians((miny + maxy) / 2)))
+    ax.axis('off')
+    return fig, ax
+
+
+def _saveFigure(fig, out, dpi, bgcolor):
+    if out is not None:
+        fig.savefig(out, dpi=dpi, facecolor=bgcolor, bbox_inches='tight')
+
+
+def _plotNetwork(
+        G, colours, sizes, minEdgeLength=0, alpha=0.8, dpi=300,
+        figsize=(15,15), out=None, bgcolor='#111111', edgeColour='#999999'):
+    """ Draw edges above minEdgeLength and nodes directly from CSR arrays """
+    network = G if isinstance(G, roadNetwork) else roadNetwork.fromGraph(G)
+    fig, ax = _newAxes(network, figsize, bgcolor)
+    source = np.repeat(np.arange(len(network)), np.diff(network.indptr))
+    keep = network.length >= minEdgeLength
+    u, v = source[keep], network.indices[keep]
+    segments = np.stack([
+        np.column_stack([network.x[u], network.y[u]]),
+        np.column_stack([network.x[v], network.y[v]])], axis=1)
+    ax.add_collection(matplotlib.collections.LineCollection(
+        segments, colors=edgeColour, linewidths=1, alpha=1, zorder=1))
+    shown = sizes > 0
+    ax.scatter(
+        network.x[shown], network.y[shown], s=sizes[shown],
+        c=colours[shown], alpha=alpha, linewidths=0, zorder=2)
+    _saveFigure(fig, out, dpi, bgcolor)
+    return fig, ax
+
+
+def _rasterTravelTime(
+        G, distances, quantile=True, maxQuant=0.95, cmap='viridis_r',
+        raster=1000, dpi=300, figsize=(15,15), out=None, bgcolor='#111111'):
+    """ Rasterise minimum node distance per pixel and draw with imshow """
+    network = G if isinstance(G, roadNetwork) else roadNetwork.fromGraph(G)
+    norm = _getNorm(distances, 0, maxQuant, quantile)
+    index = distances.index.get_indexer(network.nodes)
+    reached = index >= 0
+    distance = distances['Distance'].to_numpy(dtype=float)[index[reached]]
+    x, y = network.x[reached], network.y[reached]
+    minx, miny, maxx, maxy = network.bounds
+    scale = raster / max(maxx - minx, maxy - miny)
+    width = int(np.ceil((maxx - minx) * scale)) + 1
+    height = int(np.ceil((maxy - miny) * scale)) + 1
+    col = ((x - minx) * scale).astype(np.int64)
+    row = ((maxy - y) * scale).astype(np.int64)
+    grid = np.full(height * width, np.inf)
+    np.fmin.at(grid, row * width + col, distance)
+    grid = np.where(np.isinf(grid), np.nan, grid).reshape(height, width)
+    fig, ax = _newAxes(network, figsize, bgcolor)
+    ax.imshow(
+        grid, cmap=cmap, norm=norm, interpolation='nearest',
+        extent=(minx, minx + (width / scale), maxy - (height / scale), maxy),
+        aspect=ax.get_aspect())
+    _saveFigure(fig, out, dpi, bgcolor)
     return fig, ax
 
 
@@ -133,3 +387,79 @@ def timeline(df: pd.DataFrame, colour='group'):
         xanchor='left', x=0.01
     ))
     return fig
+
+
+def _initRenderer():
+    """ Start one persistent static image renderer per worker process """
+    try:
+        import kaleido
+    except ModuleNotFoundError:
+        logger.error('kaleido not found - static export unavailable.')
+        return
+    # kaleido >= 1 needs an explicit server to reuse its browser process;
+    # older versions keep a persistent subprocess automatically
+    if hasattr(kaleido, 'start_sync_server'):
+        kaleido.start_sync_server(silence_warnings=True)
+
+
+def _setOffline(fig):
+    """ Replace remote map tiles with a blank background """
+    for key in ['map', 'mapbox']:
+        if any(trace.type.endswith(key) for trace in fig.data):
+            fig.update_layout({f'{key}_style': 'white-bg'})
+    return fig
+
+
+def _exportFigure(spec: dict, outdir: str, formats: list, offline: bool):
+    """ Build one figure from its spec and write it in each format """
+    name = spec.get('name')
+    result = {'name': name, 'error': None}
+    try:
+        func = spec['func']
+        func = globals()[func] if isinstance(func, str) else func
+        start = time.perf_counter()
+        fig = func(*spec.get('args', ()), **spec.get('kwargs', {}))
+        if offline:
+            fig = _setOffline(fig)
+        result['build'] = time.perf_counter() - start
+        for fmt in formats:
+            path = f'{outdir}/{name}.{fmt}'
+            start = time.perf_counter()
+            if fmt == 'html':
+                # Embed plotly.js so the file renders without network access
+                fig.write_html(path, include_plotlyjs=True)
+            else:
+                fig.write_image(path, format=fmt)
+            result[fmt] = time.perf_counter() - start
+    except Exception as exc:
+        logger.error(f'Failed to export {name}: {exc!r}')
+        result['error'] = repr(exc)
+    return result
+
+
+def exportFigures(specs: list, outdir: str, formats=('png',),
+                  workers: int = None, offline: bool = True):
+    """ Build and export figures across a process pool.
+
+    Each spec is a dict with a unique 'name', a 'func' (name of a
+    visualise function or a picklable callable returning a plotly
+    figure) and optional 'args' / 'kwargs'. Returns a DataFrame of
+    build and export time (seconds) per figure and format.
+    """
+    os.makedirs(outdir, exist_ok=True)
+    formats = list(formats)
+    with ProcessPoolExecutor(
+            max_workers=workers, initializer=_initRenderer) as pool:
+        futures = ([
+            pool.submit(_exportFigure, spec, outdir, formats, offline)
+            for spec in specs
+        ])
+        results = []
+        for spec, future in zip(specs, futures):
+            try:
+                results.append(future.result())
+            except Exception as exc:
+                # e.g. an unpicklable spec or a crashed worker
+                logger.error(f'Failed to export {spec.get("name")}: {exc!r}')
+                results.append({'name': spec.get('name'), 'error': repr(exc)})
+    return pd.DataFrame(results).set_index('name')
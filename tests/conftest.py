@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+
+import threading
+import http.server
+import pytest
+
+
+@pytest.fixture
+def serve():
+    """ Start a local HTTP server for a handler class and return its URL """
+    servers = []
+
+    def start(handler):
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        servers.append(server)
+        return f'http://127.0.0.1:{server.server_port}'
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
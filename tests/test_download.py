@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+
+import io
+import sys
+import gzip
+import json
+import shutil
+import pathlib
+import functools
+import socket
+import struct
+import hashlib
+import zipfile
+import http.client
+import http.server
+import pytest
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from esneft_tools import download
+from esneft_tools.network import roadNetwork
+
+
+DATA = pathlib.Path(__file__).resolve().parents[1] / 'data'
+
+
+PAYLOAD = bytes(range(256)) * 19_532 + b'end'
+
+
+class _rangeHandler(http.server.BaseHTTPRequestHandler):
+    """ Serve PAYLOAD with Range support, failing requests on demand """
+    payload = PAYLOAD
+    failures = []
+    requests = []
+
+    def do_GET(self):
+        byteRange = self.headers.get('Range')
+        start = 0 if byteRange is None else int(byteRange[6:].split('-')[0])
+        self.requests.append(start)
+        body = self.payload[start:]
+        failure = self.failures.pop(0) if self.failures else None
+        self.send_response(200 if byteRange is None else 206)
+        self.send_header('Content-Length', str(len(body)))
+        if byteRange is not None:
+            self.send_header(
+                'Content-Range',
+                f'bytes {start}-{len(self.payload) - 1}/{len(self.payload)}')
+        self.end_headers()
+        if failure is None:
+            self.wfile.write(body)
+            return
+        self.wfile.write(body[:len(body) // 3])
+        self.wfile.flush()
+        if failure == 'reset':
+            # Close with SO_LINGER 0 to send a TCP RST mid-body
+            self.request.setsockopt(
+                socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            self.request.close()
+        self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+def _handler(failures):
+    return type('handler', (_rangeHandler,), {
+        'failures': list(failures), 'requests': []})
+
+
+@pytest.fixture
+def getData(tmp_path):
+    return download.getData(cache=str(tmp_path / 'cache'))
+
+
+@pytest.mark.parametrize('failures', [
+    [], ['short'], ['reset'], ['short', 'reset'], ['reset', 'reset']])
+def test_download_resumes(serve, getData, tmp_path, failures):
+    handler = _handler(failures)
+    url = serve(handler)
+    out = tmp_path / 'out.bin'
+    sha256 = getData._download(f'{url}/data.bin', str(out), readSize=65_536)
+    assert out.read_bytes() == PAYLOAD
+    assert sha256 == hashlib.sha256(PAYLOAD).hexdigest()
+    assert len(handler.requests) == len(failures) + 1
+    assert all(start > 0 for start in handler.requests[1:])
+
+
+def test_download_gives_up(serve, getData, tmp_path):
+    url = serve(_handler(['reset'] * 3))
+    with pytest.raises((ConnectionError, http.client.HTTPException)):
+        getData._download(
+            f'{url}/data.bin', str(tmp_path / 'out.bin'), retries=2)
+
+
+def test_fetch_host_hashes_while_streaming(serve, getData):
+    data = {'a': 1, 'b': [1, 2, 3]}
+
+    class handler(_rangeHandler):
+        payload = json.dumps(data).encode()
+        failures = []
+        requests = []
+
+    getData.host = serve(handler)
+    # The streamed hash is committed as-is so the file is not re-read
+    getData.store.hasher = None
+    _, path = getData._fromCache('test.json')
+    with open(path) as fh:
+        assert json.load(fh) == data
+    entry = getData.store.entry('test.json')
+    assert entry['sha256'] == hashlib.sha256(handler.payload).hexdigest()
+    assert path.endswith(f'{entry["sha256"]}.json')
+
+
+def test_open_member_hashes_while_reading(getData):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zipRef:
+        zipRef.writestr('Data/other.txt', b'ignored')
+        zipRef.writestr('Data/member.csv', PAYLOAD)
+    with zipfile.ZipFile(buffer) as zipRef:
+        member = getData._findMember(zipRef, 'Data/*.csv')
+        assert member == 'Data/member.csv'
+        # Only part of the member is consumed by the caller
+        with getData._openMember(zipRef, member, 'gpStaff') as fh:
+            assert fh.read(100) == PAYLOAD[:100]
+    assert getData.observedHashes['gpStaff'] == (
+        hashlib.sha256(PAYLOAD).hexdigest())
+
+
+@pytest.fixture
+def host(serve, tmp_path):
+    """ Serve a copy of the bundled data directory over HTTP """
+    directory = tmp_path / 'host'
+    shutil.copytree(DATA, directory)
+    handler = functools.partial(
+        http.server.SimpleHTTPRequestHandler, directory=str(directory))
+    handler.log_message = lambda *args: None
+    return directory, serve(handler)
+
+
+def test_from_host_list(host, getData):
+    _, getData.host = host
+    names = ['qof', 'imdLSOA', 'esneftLSOA']
+    data = getData.fromHost(names)
+    assert list(data) == names
+    for name in ['qof', 'imdLSOA']:
+        expected = pd.read_parquet(DATA / getData.options[name])
+        pd.testing.assert_frame_equal(
+            data[name].sort_index(), expected.sort_index())
+    assert len(data['esneftLSOA']) > 0
+    assert getData.hostErrors == {}
+
+
+def test_from_host_isolates_failures(host, getData):
+    _, getData.host = host
+    # postcode-lsoa.parquet is not bundled so the request fails
+    data = getData.fromHost(['qof', 'postcodeLSOA'])
+    assert data['postcodeLSOA'] is None
+    assert list(getData.hostErrors) == ['postcodeLSOA']
+    assert len(data['qof']) > 0
+
+
+def test_from_host_all(host, getData):
+    _, getData.host = host
+    data = getData.fromHost('all')
+    assert list(data) == list(getData.options)
+    bundled = {
+        name for name, file in getData.options.items()
+        if (DATA / file).exists()}
+    assert bundled and set(getData.hostErrors).isdisjoint(bundled)
+    for name in bundled:
+        assert len(data[name]) > 0
+    for name in getData.hostErrors:
+        assert data[name] is None
+
+
+def _cacheNetwork(directory, getData):
+    """ Host a stand-in OSM file and cache a matching roadNetwork """
+    osm = b'<osm version="0.6"></osm>'
+    with gzip.open(directory / 'esneft-highways.osm.gz', 'wb') as fh:
+        fh.write(osm)
+    network = roadNetwork(
+        ['a', 'b', 'c'], [1.0, 1.1, 1.2], [52.0, 52.1, 52.2],
+        [0, 1, 2, 2], [1, 2], [10.0, 20.0])
+    network.save(getData._getOSMcache(), hashlib.sha256(osm).hexdigest())
+    return network
+
+
+def test_from_host_osm_process(host, getData):
+    directory, getData.host = host
+    expected = _cacheNetwork(directory, getData)
+    data = getData.fromHost(['qof', 'esneftOSM'], osmProcess=True)
+    assert getData.hostErrors == {}
+    network = data['esneftOSM']
+    assert isinstance(network, roadNetwork)
+    assert network.path == getData._getOSMcache()
+    np.testing.assert_array_equal(network.indices, expected.indices)
+    # Loaded from the memory-mapped cache, not copied back from the worker
+    assert not network.indices.flags.owndata
+    assert len(data['qof']) > 0
+
+
+def test_from_host_retries_evicted(host, getData, monkeypatch):
+    _, getData.host = host
+    getData.fromHost('qof')
+    fromCache = getData._fromCache
+    evicted = []
+
+    def evictAfterGet(file):
+        # Another process evicts the object between get() and the read
+        key, out = fromCache(file)
+        if not evicted:
+            getData.store.remove(key)
+            evicted.append(key)
+        return key, out
+
+    monkeypatch.setattr(getData, '_fromCache', evictAfterGet)
+    data = getData.fromHost('qof')
+    assert evicted == ['qof.parquet']
+    assert len(data) > 0
+    assert getData.store.entry('qof.parquet') is not None
+
+
+def test_sort_parquet(getData, tmp_path):
+    rng = np.random.default_rng(42)
+    size = 50_000
+    lsoas = [f'E{i:08d}' for i in range(1_000)] + [None]
+    data = pd.DataFrame({
+        'LSOA11CD': rng.choice(lsoas, size),
+        'Lat': rng.random(size),
+    }, index=pd.Index([f'P{i:06d}' for i in range(size)], name='PCDS'))
+    # Blocks sorted independently, as streamed from NSPL
+    with pq.ParquetWriter(
+            tmp_path / 'unsorted.parquet',
+            pa.Schema.from_pandas(data, preserve_index=True)) as writer:
+        for start in range(0, size, 12_000):
+            block = data.iloc[start:start + 12_000].sort_values(
+                'LSOA11CD', kind='stable')
+            writer.write_table(pa.Table.from_pandas(block, preserve_index=True))
+    getData._sortParquet(
+        tmp_path / 'unsorted.parquet', tmp_path / 'sorted.parquet',
+        'LSOA11CD', bucketRows=10_000, rowGroupSize=5_000)
+    expected = data.sort_values('LSOA11CD', kind='stable', na_position='last')
+    pd.testing.assert_frame_equal(
+        pd.read_parquet(tmp_path / 'sorted.parquet'), expected,
+        check_index_type=False)
+    # Row groups cover consecutive, non-overlapping LSOA ranges
+    metadata = pq.ParquetFile(tmp_path / 'sorted.parquet').metadata
+    ranges = [
+        (stats.min, stats.max) for stats in
+        (metadata.row_group(i).column(0).statistics
+         for i in range(metadata.num_row_groups)) if stats.has_min_max]
+    assert all(a[1] <= b[0] for a, b in zip(ranges, ranges[1:]))
+
+
+def _hostGeoJSON(directory):
+    geojson = {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'id': 'E01000001', 'properties': {},
+         'geometry': {'type': 'Polygon', 'coordinates': [
+             [[1.0, 52.0], [1.1, 52.0], [1.1, 52.1], [1.0, 52.0]]]}}]}
+    with open(directory / 'lsoa-map-esneft.geojson', 'w') as fh:
+        json.dump(geojson, fh)
+    return geojson
+
+
+def test_geometry_without_shapely(host, getData, monkeypatch):
+    directory, getData.host = host
+    geojson = _hostGeoJSON(directory)
+    monkeypatch.delitem(sys.modules, 'shapely', raising=False)
+    assert getData.fromHost('geoLSOA') == geojson
+    with pytest.raises(ImportError, match='esneft_tools\\[geo\\]'):
+        getData.fromHost('geoLSOA', tier='coarse')
+
+
+def test_geometry_tiers(host, getData):
+    pytest.importorskip('shapely')
+    directory, getData.host = host
+    geojson = _hostGeoJSON(directory)
+    assert getData.fromHost('geoLSOA')['features'][0]['id'] == 'E01000001'
+    coarse = getData.fromHost('geoLSOA', tier='coarse')
+    assert len(coarse['features']) == len(geojson['features'])
+    assert getData.store.entry('lsoa-map-esneft.geoparquet') is not None
+
+
+def test_source_lsoa(host, getData, monkeypatch):
+    directory, getData.host = host
+    esneftLSOA = pd.read_json(DATA / 'lsoa-esneft.json', typ='series')
+    rows = ([
+        ('AB1 1AA', 'E01999999', 52.0, 1.0),
+        ('AB1 1AB', '', 99.999999, 0.0),
+        ('AB1 1AC', esneftLSOA.iloc[0], 52.1, 1.1),
+        ('AB1 1AD', 'E01000001', 51.5, -0.1),
+    ])
+    lines = [','.join(f'h{j}' for j in range(41))]
+    for pcds, lsoa, lat, long in rows:
+        fields = ['x'] * 41
+        fields[2], fields[25] = pcds, lsoa
+        fields[33], fields[34] = str(lat), str(long)
+        lines.append(','.join(fields))
+    csvText = '\n'.join(lines) + '\n'
+    with zipfile.ZipFile(directory / 'nspl.zip', 'w') as zipRef:
+        zipRef.writestr('Data/NSPL21_NOV_2022_UK.csv', csvText)
+    url = f'{getData.host}/nspl.zip'
+    monkeypatch.setattr(
+        download.getData, 'sourceURL',
+        property(lambda self: {'postcodeLSOA': url}))
+    monkeypatch.setattr(
+        download.getData, 'expectedHashes',
+        property(lambda self: {'postcodeLSOA': ''}))
+    fromHost = getData.fromHost
+    monkeypatch.setattr(
+        getData, 'fromHost',
+        lambda name, **kwargs: (
+            None if name == 'esneftOSM' else fromHost(name, **kwargs)))
+    data = getData._sourceLSOA()
+    assert data.index.name == 'PCDS'
+    assert pd.isna(data.loc['AB1 1AB', 'LSOA11CD'])
+    assert pd.isna(data['LSOA11CD'].iloc[-1])
+    assert data.loc['AB1 1AC', 'ESNEFT']
+    assert list(data['LSOA11CD'].dropna()) == sorted(data['LSOA11CD'].dropna())
+    cached = getData.fromHost('postcodeLSOA')
+    assert cached['LSOA11CD'].isna().sum() == 1
+
+
+def test_bundle_records_reads(getData, host):
+    _, getData.host = host
+    data = getData.lazy(['qof', 'gpStaff', 'imdLSOA'])
+
+    def summary(bundle, qof):
+        return len(qof) + len(bundle['gpStaff'])
+
+    data.call(summary, data)
+    assert data.accessed['summary'] == ['qof', 'gpStaff']
+    assert sorted(data.loaded) == ['gpStaff', 'qof']
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+import numpy as np
+import pytest
+from esneft_tools import network
+from esneft_tools.network import roadNetwork
+
+
+def _network():
+    return roadNetwork(
+        ['a', 'b', 'c'], [1.0, 1.1, 1.2], [52.0, 52.1, 52.2],
+        [0, 1, 2, 2], [1, 2], [10.0, 20.0])
+
+
+def test_spatial_index_cache(tmp_path):
+    pytest.importorskip('scipy')
+    _network().save(tmp_path / 'net.csr')
+    loaded = roadNetwork.load(tmp_path / 'net.csr')
+    expected = loaded.nearestNodes([52.09, 52.21], [1.09, 1.19])
+    # Coordinates are cached as .npy (not pickled) and the tree rebuilt
+    assert (tmp_path / 'net.csr' / 'kdtree.npy').exists()
+    reloaded = roadNetwork.load(tmp_path / 'net.csr')
+    np.testing.assert_array_equal(
+        reloaded.nearestNodes([52.09, 52.21], [1.09, 1.19]), expected)
+    assert list(expected) == ['b', 'c']
+
+
+def test_save_concurrent(tmp_path, monkeypatch):
+    path = str(tmp_path / 'net.csr')
+    replace = network.os.replace
+    raced = []
+
+    def racingReplace(src, dst):
+        # Another process finishes caching just before this rename
+        if not raced:
+            raced.append(dst)
+            _network().save(dst, sourceHash='abc')
+        return replace(src, dst)
+
+    monkeypatch.setattr(network.os, 'replace', racingReplace)
+    _network().save(path, sourceHash='abc')
+    assert raced == [path]
+    assert roadNetwork.readMeta(path)['sourceHash'] == 'abc'
+    assert [p.name for p in tmp_path.iterdir()] == ['net.csr']
+
+
+def test_save_replaces_stale(tmp_path):
+    path = str(tmp_path / 'net.csr')
+    _network().save(path, sourceHash='old')
+    _network().save(path, sourceHash='new')
+    assert roadNetwork.readMeta(path)['sourceHash'] == 'new'
+    assert [p.name for p in tmp_path.iterdir()] == ['net.csr']
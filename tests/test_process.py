@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+import pandas as pd
+import pytest
+from esneft_tools import process
+from esneft_tools.network import roadNetwork
+
+
+def _inputs():
+    practices = pd.Index(['P1', 'P2', 'P3'], name='OrganisationCode')
+    return ({
+        'gpRegistration': pd.DataFrame({
+            'OrganisationCode': ['P1', 'P2', 'P3', 'P3'],
+            'LSOA11CD': ['L1', 'L2', 'L3', 'L1'],
+            'Patient': [10, 20, 30, 40]}),
+        'gpPractice': pd.DataFrame(
+            {'PCDS': ['A1', 'A2', 'A3']}, index=practices),
+        'gpStaff': pd.DataFrame({'meanStaff': [1.0, 2.0, 3.0]}, index=practices),
+        'postcodeLSOA': pd.DataFrame({
+            'Lat': [52.0, 52.1, 52.2], 'Long': [1.0, 1.1, 1.2],
+            'ESNEFT': [True, False, True]},
+            index=pd.Index(['A1', 'A2', 'A3'], name='PCDS')),
+        'imdLSOA': pd.DataFrame(
+            {'IMD': [10.0, 20.0, 30.0]},
+            index=pd.Index(['L1', 'L2', 'L3'], name='LSOA11CD')),
+        'qof': pd.DataFrame({'QOF-DM': [50.0, 60.0, 70.0]}, index=practices),
+        'esneftOSM': roadNetwork(
+            ['a', 'b', 'c'], [1.0, 1.1, 1.2], [52.0, 52.1, 52.2],
+            [0, 1, 2, 2], [1, 2], [10.0, 20.0]),
+    })
+
+
+def test_gp_summary_nodes():
+    pytest.importorskip('scipy')
+    summary = process.getGPsummary(**_inputs(), bins=2)
+    assert list(summary['Node']) == ['a', 'b', 'c']
+
+
+def test_gp_summary_without_scipy(monkeypatch, caplog):
+    monkeypatch.setattr(process, 'hasSpatialIndex', lambda: False)
+    summary = process.getGPsummary(**_inputs(), bins=2)
+    assert 'Node' not in summary.columns
+    assert 'skipping nearest road node lookup' in caplog.text
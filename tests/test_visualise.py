@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+
+import pathlib
+import pandas as pd
+from esneft_tools import visualise
+
+
+DATA = pathlib.Path(__file__).resolve().parents[1] / 'data'
+
+
+def test_export_figures_isolates_failures(tmp_path):
+    GPsummary = pd.read_parquet(DATA / 'gp-summary.parquet').head(50)
+    specs = ([
+        {'name': 'unknown', 'func': 'scaterGP'},
+        {'name': 'practices', 'func': 'scatterGP', 'args': (GPsummary,)},
+    ])
+    results = visualise.exportFigures(
+        specs, tmp_path, formats=('html',), workers=1)
+    assert list(results.index) == ['unknown', 'practices']
+    assert 'KeyError' in results.loc['unknown', 'error']
+    assert pd.isna(results.loc['practices', 'error'])
+    assert (tmp_path / 'practices.html').exists()